@@ -20,6 +20,9 @@ from util import manhattanDistance
 import util
 
 class GhostAgent( Agent ):
+    # Ghosts only look at the state, so the game does not copy it for them
+    readOnlyState = True
+
     def __init__( self, index ):
         self.index = index
 
@@ -49,33 +52,56 @@ class DirectionalGhost( GhostAgent ):
         self.prob_attack = prob_attack
         self.prob_scaredFlee = prob_scaredFlee
 
-    def getDistribution( self, state ):
+    def getActionProbabilities( self, state ):
+        """
+        Returns the legal actions in sorted order and the probability of each.
+        Moves are rated by their maze distance to Pacman, read from the
+        distance field of Pacman's cell (see Actions.getDistanceField).
+        """
         # Read variables from state
         ghostState = state.getGhostState( self.index )
-        legalActions = state.getLegalActions( self.index )
-        pos = state.getGhostPosition( self.index )
+        legalActions = sorted( state.getLegalActions( self.index ) )
+        if len( legalActions ) == 0: return [], []
+        x, y = ghostState.configuration.pos
         isScared = ghostState.scaredTimer > 0
 
         speed = 1
         if isScared: speed = 0.5
 
-        actionVectors = [Actions.directionToVector( a, speed ) for a in legalActions]
-        newPositions = [( pos[0]+a[0], pos[1]+a[1] ) for a in actionVectors]
-        pacmanPosition = state.getPacmanPosition()
+        walls = state.getWalls()
+        field = Actions.getDistanceField( walls, state.getPacmanPosition() )
+        distancesToPacman = []
+        for action in legalActions:
+            dx, dy = Actions.directionToVector( action, speed )
+            distancesToPacman.append( _fieldDistance( field, walls.height, x + dx, y + dy ) )
 
         # Select best actions given the state
-        distancesToPacman = [manhattanDistance( pos, pacmanPosition ) for pos in newPositions]
         if isScared:
             bestScore = max( distancesToPacman )
             bestProb = self.prob_scaredFlee
         else:
             bestScore = min( distancesToPacman )
             bestProb = self.prob_attack
-        bestActions = [action for action, distance in zip( legalActions, distancesToPacman ) if distance == bestScore]
+        bestShare = bestProb / distancesToPacman.count( bestScore )
+        otherShare = ( 1-bestProb ) / len( legalActions )
+        return legalActions, [( bestShare if distance == bestScore else 0 ) + otherShare for distance in distancesToPacman]
 
-        # Construct distribution
+    def getAction( self, state ):
+        legalActions, probabilities = self.getActionProbabilities( state )
+        if len( legalActions ) == 0:
+            return Directions.STOP
+        return util.sample( probabilities, legalActions )
+
+    def getDistribution( self, state ):
         dist = util.Counter()
-        for a in bestActions: dist[a] = bestProb / len(bestActions)
-        for a in legalActions: dist[a] += ( 1-bestProb ) / len(legalActions)
+        for action, probability in zip( *self.getActionProbabilities( state ) ):
+            dist[action] = probability
         dist.normalize()
         return dist
+
+def _fieldDistance( field, height, x, y ):
+    "The distance of position (x, y) in a distance field; ghosts may be halfway between two cells."
+    x_int, y_int = int( x ), int( y )
+    if x == x_int and y == y_int:
+        return field[x_int * height + y_int]
+    return min( field[x_int * height + y_int], field[int( x + 0.5 ) * height + int( y + 0.5 )] ) + 0.5
@@ -18,22 +18,15 @@ Pacman agents (in searchAgents.py).
 """
 
 import util
-import copy
-
-class Node:
-
-    def __init__(self, state, actions, pathCost):
-        self.state = state
-        self.actions = actions
-        self.pathCost = pathCost
+import heapq
+from collections import OrderedDict
 
 class SearchNode:
     """
     This class represents a node in the graph which represents the search problem.
-    The class is used as a basic wrapper for search methods - you may use it, however
-    you can solve the assignment without it.
-
-    REMINDER: You need to fill in the backtrack function in this class!
+    The class is used as a basic wrapper for search methods. Each node only stores
+    the action that led to it and a reference to its parent, so pushing a child is
+    O(1) and the full path is rebuilt by backtrack once a goal is found.
     """
 
     def __init__(self, position, parent=None, transition=None, cost=0, heuristic=0):
@@ -70,15 +63,15 @@ class SearchNode:
         final node to the initial.
         """
         moves = []
-        # make a deep copy to stop any referencing isues.
-        node = copy.deepcopy(self)
+        node = self
 
-        if node.isRootNode(): 
-            # The initial state is the final state
-            return moves        
+        # Walk the parent pointers; every node on the path is visited once
+        while not node.isRootNode():
+            moves.append(node.transition)
+            node = node.parent
 
-        "**YOUR CODE HERE**"
-        util.raiseNotDefined()
+        moves.reverse()
+        return moves
 
 
 class SearchProblem:
@@ -160,27 +153,33 @@ def breadthFirstSearch(problem):
     return searchAlgorithm(problem, queue)
 
 def searchAlgorithm(problem, list):
-    node = Node(problem.getStartState(), [], 0)
+    """
+    Generic graph search over the given frontier (stack, queue or priority
+    queue). Nodes only keep a pointer to their parent, the action list is
+    rebuilt once the goal is reached.
+    """
+    node = SearchNode(problem.getStartState())
     list.push(node)
 
     visited = {}
     while not list.isEmpty():
         node = list.pop()
-        if problem.isGoalState(node.state):
-            return node.actions
+        if problem.isGoalState(node.position):
+            return node.backtrack()
 
-        if node.state not in visited:
-            visited[node.state] = True
-            for successor, action, cost in problem.getSuccessors(node.state):
+        if node.position not in visited:
+            visited[node.position] = True
+            for successor, action, cost in problem.getSuccessors(node.position):
                 if successor not in visited:
-                    list.push(Node(successor, node.actions + [action], node.pathCost + cost))
+                    list.push(SearchNode(successor, node, action, node.cost + cost))
     return []
 
 def uniformCostSearch(problem):
     """Search the node of least total cost first."""
     "*** YOUR CODE HERE ***"
-    cost = lambda node: node.pathCost
-    priorityQueue = util.PriorityQueueWithFunction(cost)
+    cost = lambda node: node.cost
+    state = lambda node: node.position
+    priorityQueue = util.IndexedPriorityQueueWithFunction(cost, state)
     return searchAlgorithm(problem, priorityQueue)
 
 def nullHeuristic(state, problem=None):
@@ -190,16 +189,479 @@ def nullHeuristic(state, problem=None):
     """
     return 0
 
-def aStarSearch(problem, heuristic=nullHeuristic):
-    """Search the node that has the lowest combined cost and heuristic first."""
+class HeuristicCache:
+    """
+    Memoizes a heuristic on the (hashed) search state, so a state reached
+    through several parents is only evaluated once. At most maxSize values
+    are kept; the least recently used one is evicted first.
+
+    Hit and miss counts are stored on the problem as _heuristicHits and
+    _heuristicMisses so they can be reported next to _expanded.
+    """
+
+    def __init__(self, heuristic, maxSize=100000):
+        self.heuristic = heuristic
+        self.maxSize = maxSize
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state, problem=None):
+        if state in self.values:
+            # Re-insert to mark the value as the most recently used
+            value = self.values.pop(state)
+            self.hits += 1
+        else:
+            value = self.heuristic(state, problem)
+            self.misses += 1
+            if len(self.values) >= self.maxSize:
+                self.values.popitem(last=False)
+        self.values[state] = value
+
+        if problem is not None:
+            problem._heuristicHits = self.hits
+            problem._heuristicMisses = self.misses
+        return value
+
+def aStarSearch(problem, heuristic=nullHeuristic, cacheSize=0):
+    """
+    Search the node that has the lowest combined cost and heuristic first.
+
+    If cacheSize is positive, heuristic values are memoized per state in a
+    HeuristicCache holding at most cacheSize entries.
+    """
     "*** YOUR CODE HERE ***"
-    cost = lambda node: node.pathCost + heuristic(node.state, problem)
-    priorityQueue = util.PriorityQueueWithFunction(cost)
+    if int(cacheSize) > 0:
+        heuristic = HeuristicCache(heuristic, int(cacheSize))
+    cost = lambda node: node.cost + heuristic(node.position, problem)
+    state = lambda node: node.position
+    priorityQueue = util.IndexedPriorityQueueWithFunction(cost, state)
     return searchAlgorithm(problem, priorityQueue)
 
+def iterativeDeepeningAStarSearch(problem, heuristic=nullHeuristic, maxExpansions=0):
+    """
+    Iterative deepening A* (IDA*): repeated depth-first searches, each bounded
+    by f = g + h, where the next bound is the smallest f that exceeded the
+    previous one. Only the current path is kept in memory; states are only
+    checked against that path, not against a closed set.
+
+    If maxExpansions is positive the search gives up (returning an empty list)
+    once that many nodes have been expanded over all iterations.
+    """
+    maxExpansions = int(maxExpansions)
+    start = problem.getStartState()
+    bound = heuristic(start, problem)
+    expansions = 0
+
+    while True:
+        nextBound = float('inf')
+        root = SearchNode(start, heuristic=bound)
+        path, successors, onPath = [root], [None], set([start])
+
+        while path:
+            node = path[-1]
+            if successors[-1] is None:
+                # First visit of this node in the current iteration
+                f = node.cost + node.heuristic
+                if f > bound:
+                    nextBound = min(nextBound, f)
+                    onPath.discard(node.position)
+                    path.pop()
+                    successors.pop()
+                    continue
+                if problem.isGoalState(node.position):
+                    return node.backtrack()
+                if maxExpansions and expansions >= maxExpansions:
+                    return []
+                expansions += 1
+                successors[-1] = iter(problem.getSuccessors(node.position))
+
+            for successor, action, cost in successors[-1]:
+                if successor not in onPath:
+                    child = SearchNode(successor, node, action, node.cost + cost, heuristic(successor, problem))
+                    path.append(child)
+                    successors.append(None)
+                    onPath.add(successor)
+                    break
+            else:
+                onPath.discard(node.position)
+                path.pop()
+                successors.pop()
+
+        if nextBound == float('inf'):
+            return []
+        bound = nextBound
+
+class MemoryBoundedNode(SearchNode):
+    """
+    A SearchNode for memoryBoundedAStarSearch. Besides the path information it
+    keeps its (backed up) f-value, its depth, the children currently in memory
+    and, by position, the successors which are not: those not generated yet
+    and those dropped to free memory, with their (backed up) f-value, action,
+    step cost and heuristic.
+    """
+
+    def __init__(self, position, parent=None, transition=None, cost=0, heuristic=0):
+        SearchNode.__init__(self, position, parent, transition, cost, heuristic)
+        self.f = cost + heuristic
+        self.depth = 0
+        if parent is not None:
+            self.depth = parent.depth + 1
+        self.children = []
+        self.forgotten = {}
+        self.expanded = False
+        self.alive = True
+
+    def isLeaf(self):
+        return len(self.children) == 0
+
+    def openValue(self):
+        "The f-value of the node the next expansion of this one generates, None if there is none."
+        if not self.expanded:
+            return self.f
+        if self.forgotten:
+            return min(entry[0] for entry in self.forgotten.values())
+        return None
+
+    def backedUpValue(self):
+        "The lowest f-value among children in memory and forgotten children."
+        values = [child.f for child in self.children] + [entry[0] for entry in self.forgotten.values()]
+        if not values:
+            return float('inf')
+        return min(values)
+
+def memoryBoundedAStarSearch(problem, heuristic=nullHeuristic, maxNodes=100000):
+    """
+    Simplified memory-bounded A* (SMA*). Behaves like A* until maxNodes search
+    nodes are held in memory; then the shallowest leaf with the highest f is
+    dropped and its f-value is remembered by its parent. A node stays in the
+    queue while it has successors that are not in memory (dropped or not
+    generated yet), keyed by the best of their f-values, and regenerates that
+    successor when it is the most promising node.
+
+    Successors are generated one at a time, so a solution is found when its
+    path fits into maxNodes nodes, and with an admissible heuristic the path
+    found is optimal when an optimal one fits. Returns an empty list if no
+    solution fits into the budget.
+    """
+    maxNodes = max(int(maxNodes), 2)
+    infinity = float('inf')
+    counter = [0]
+    used = [1]
+    best, worst = [], []
+
+    def addOpen(node):
+        # Nodes with something to generate, lowest f / deepest first. Entries
+        # are pushed again when the value changes; outdated ones are skipped.
+        value = node.openValue()
+        if value is not None:
+            counter[0] += 1
+            heapq.heappush(best, (value, -node.depth, counter[0], node))
+
+    def addLeaf(node):
+        # Leaves that may be dropped, highest f / shallowest first
+        if node.isLeaf() and node is not root:
+            counter[0] += 1
+            heapq.heappush(worst, (-node.f, node.depth, counter[0], node))
+
+    def popOpen():
+        while best:
+            value, _, _, node = heapq.heappop(best)
+            if node.alive and node.openValue() == value:
+                return node
+        return None
+
+    def popLeaf(exclude):
+        skipped, found = [], None
+        while worst:
+            entry = heapq.heappop(worst)
+            node = entry[-1]
+            if not node.alive or not node.isLeaf() or node.f != -entry[0]:
+                continue
+            if node is exclude:
+                skipped.append(entry)
+                continue
+            found = node
+            break
+        for entry in skipped:
+            heapq.heappush(worst, entry)
+        return found
+
+    def backup(node):
+        # Propagate changed f-values towards the root
+        while node is not None and node.expanded:
+            value = node.backedUpValue()
+            if value == node.f:
+                break
+            node.f = value
+            addLeaf(node)
+            node = node.parent
+
+    def remove(node):
+        node.alive = False
+        node.parent.children.remove(node)
+        if inMemory.get(node.position) is node:
+            del inMemory[node.position]
+        used[0] -= 1
+        return node.parent
+
+    def forget(node):
+        # Drop a leaf, remembering how to regenerate it in its parent
+        parent = remove(node)
+        parent.forgotten[node.position] = (node.f, node.transition, node.cost - parent.cost, node.heuristic)
+        addOpen(parent)
+        addLeaf(parent)
+
+    def discard(node):
+        # Remove nodes that have nothing left to generate
+        while node is not root and node.isLeaf() and not node.forgotten:
+            node = remove(node)
+        backup(node)
+        addLeaf(node)
+
+    def dominated(position, g, depth):
+        # A node in memory reaches position at most as deep and as expensively
+        known = inMemory.get(position)
+        return known is not None and known.cost <= g and known.depth <= depth
+
+    start = problem.getStartState()
+    root = MemoryBoundedNode(start, heuristic=heuristic(start, problem))
+    inMemory = {start: root}
+    addOpen(root)
+
+    while True:
+        node = popOpen()
+        if node is None or node.openValue() == infinity:
+            return []
+
+        if not node.expanded:
+            if problem.isGoalState(node.position):
+                return node.backtrack()
+            node.expanded = True
+            # The path to a successor of a node this deep cannot fit into memory
+            if node.depth < maxNodes - 1:
+                ancestors = set()
+                ancestor = node
+                while ancestor is not None:
+                    ancestors.add(ancestor.position)
+                    ancestor = ancestor.parent
+                for successor, action, cost in problem.getSuccessors(node.position):
+                    g = node.cost + cost
+                    if successor in ancestors or dominated(successor, g, node.depth + 1):
+                        continue
+                    h = heuristic(successor, problem)
+                    entry = (max(g + h, node.f), action, cost, h)
+                    if entry[0] < node.forgotten.get(successor, (infinity,))[0]:
+                        node.forgotten[successor] = entry
+            if node.forgotten:
+                addOpen(node)
+                backup(node)
+            else:
+                discard(node)
+            continue
+
+        # Regenerate the most promising successor that is not in memory
+        f, position = min((entry[0], position) for position, entry in node.forgotten.items())
+        f, action, cost, h = node.forgotten.pop(position)
+        if dominated(position, node.cost + cost, node.depth + 1):
+            if node.forgotten or not node.isLeaf():
+                addOpen(node)
+                backup(node)
+            else:
+                discard(node)
+            continue
+        child = MemoryBoundedNode(position, node, action, node.cost + cost, h)
+        child.f = max(child.f, f)
+        node.children.append(child)
+        inMemory[position] = child
+        used[0] += 1
+        addOpen(node)
+        addOpen(child)
+        addLeaf(child)
+
+        while used[0] > maxNodes:
+            dropped = popLeaf(child)
+            if dropped is None:
+                break
+            forget(dropped)
+
+class _GoalAtStart:
+    """
+    A view of a problem whose goal is the start state, so that heuristics
+    written against problem.goal estimate the distance back to the start.
+    """
+
+    def __init__(self, problem):
+        self.problem = problem
+        self.goal = problem.getStartState()
+
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
+
+def bidirectionalSearch(problem, heuristic=nullHeuristic):
+    """
+    Bidirectional A* for problems with a single explicit goal (problem.goal)
+    and reversible moves. Besides getSuccessors the problem has to provide
+    getPredecessors(state), which returns (predecessor, action, stepCost)
+    triples for the moves predecessor -> state.
+
+    Both directions run A* on the balanced potential
+    p(s) = (h(s, goal) - h(s, start)) / 2, so the forward and backward keys
+    are g + p and g - p; the search stops once the two smallest keys add up
+    to the cheapest path found where the frontiers met. With the null
+    heuristic this is bidirectional uniform cost search, i.e. bidirectional
+    BFS for unit step costs.
+    """
+    start, goal = problem.getStartState(), problem.goal
+    if problem.isGoalState(start):
+        return []
+    towardsStart = _GoalAtStart(problem)
+    potential = lambda state: (heuristic(state, problem) - heuristic(state, towardsStart)) / 2.0
+
+    forward = (util.IndexedPriorityQueue(), {start: SearchNode(start)}, set(), problem.getSuccessors, 1)
+    backward = (util.IndexedPriorityQueue(), {goal: SearchNode(goal)}, set(), problem.getPredecessors, -1)
+    forward[0].push(forward[1][start], potential(start), start)
+    backward[0].push(backward[1][goal], -potential(goal), goal)
+
+    bestCost, meeting = float('inf'), None
+    while not forward[0].isEmpty() and not backward[0].isEmpty():
+        if forward[0].topPriority() + backward[0].topPriority() >= bestCost:
+            break
+        # Expand the direction with the smaller frontier
+        if len(forward[0].entries) <= len(backward[0].entries):
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+        frontier, nodes, closed, expand, sign = side
+
+        node = frontier.pop()
+        closed.add(node.position)
+        for successor, action, cost in expand(node.position):
+            if successor in closed:
+                continue
+            g = node.cost + cost
+            known = nodes.get(successor)
+            if known is None or g < known.cost:
+                child = SearchNode(successor, node, action, g)
+                nodes[successor] = child
+                frontier.push(child, g + sign * potential(successor), successor)
+                if successor in other[1] and g + other[1][successor].cost < bestCost:
+                    bestCost, meeting = g + other[1][successor].cost, successor
+
+    if meeting is None:
+        return []
+
+    # Forward half from the start, then follow the backward tree to the goal
+    actions = forward[1][meeting].backtrack()
+    node = backward[1][meeting]
+    while not node.isRootNode():
+        actions.append(node.transition)
+        node = node.parent
+    return actions
+
+def jumpPointSearch(problem, heuristic=nullHeuristic):
+    """
+    Jump point search (JPS): A* for 4-connected grid problems with unit step
+    costs whose walls are given as problem.walls (a game.Grid), such as
+    PositionSearchProblem and AnyFoodSearchProblem.
+
+    Instead of pushing every neighbouring cell, the search runs from each
+    expanded cell in a straight line and only stops at a goal or at a jump
+    point, i.e. a cell where a wall ends beside the line and a shortest path
+    may have to turn. Horizontal lines stop at such cells only; vertical
+    lines also look sideways from every cell they pass, so a path turning
+    there is not lost. Cells in between lie only on paths symmetric to one
+    through the jump points and are never queued.
+
+    Only jump points are counted in problem._expanded; the returned actions
+    still walk the path one cell at a time.
+    """
+    from game import Actions
+    walls, isGoalState = problem.walls, problem.isGoalState
+
+    def jumpHorizontally(x, y, dx):
+        "The first jump point or goal reached from (x, y) moving along dx, or None."
+        while True:
+            x += dx
+            if walls[x][y]:
+                return None
+            if isGoalState((x, y)):
+                return (x, y)
+            if (walls[x - dx][y + 1] and not walls[x][y + 1]) or \
+               (walls[x - dx][y - 1] and not walls[x][y - 1]):
+                return (x, y)
+
+    def jumpVertically(x, y, dy):
+        "The first jump point or goal reached from (x, y) moving along dy, or None."
+        while True:
+            y += dy
+            if walls[x][y]:
+                return None
+            if isGoalState((x, y)):
+                return (x, y)
+            if (walls[x + 1][y - dy] and not walls[x + 1][y]) or \
+               (walls[x - 1][y - dy] and not walls[x - 1][y]):
+                return (x, y)
+            if jumpHorizontally(x, y, 1) or jumpHorizontally(x, y, -1):
+                return (x, y)
+
+    # Directions to try after arriving along a given one; None at the start
+    natural = {
+        None: [(1, 0), (-1, 0), (0, 1), (0, -1)],
+        (1, 0): [(1, 0), (0, 1), (0, -1)],
+        (-1, 0): [(-1, 0), (0, 1), (0, -1)],
+        (0, 1): [(0, 1), (1, 0), (-1, 0)],
+        (0, -1): [(0, -1), (1, 0), (-1, 0)],
+    }
+
+    start = problem.getStartState()
+    frontier = util.IndexedPriorityQueue()
+    frontier.push(SearchNode(start), heuristic(start, problem), start)
+    closed = set()
+
+    while not frontier.isEmpty():
+        node = frontier.pop()
+        if isGoalState(node.position):
+            # Every leg is a straight line, so repeat its action over its length
+            moves = []
+            while not node.isRootNode():
+                (x, y), (px, py) = node.position, node.parent.position
+                moves.extend([node.transition] * (abs(x - px) + abs(y - py)))
+                node = node.parent
+            moves.reverse()
+            return moves
+        closed.add(node.position)
+
+        # Bookkeeping for display purposes, as in PositionSearchProblem
+        problem._expanded += 1
+        if node.position not in problem._visited:
+            problem._visited[node.position] = True
+            problem._visitedlist.append(node.position)
+
+        x, y = node.position
+        arrival = None
+        if not node.isRootNode():
+            vector = Actions.directionToVector(node.transition)
+            arrival = (int(vector[0]), int(vector[1]))
+        for dx, dy in natural[arrival]:
+            if dx:
+                jumpPoint = jumpHorizontally(x, y, dx)
+            else:
+                jumpPoint = jumpVertically(x, y, dy)
+            if jumpPoint is None or jumpPoint in closed:
+                continue
+            cost = node.cost + abs(jumpPoint[0] - x) + abs(jumpPoint[1] - y)
+            child = SearchNode(jumpPoint, node, Actions.vectorToDirection((dx, dy)), cost)
+            frontier.push(child, cost + heuristic(jumpPoint, problem), jumpPoint)
+    return []
+
 
 # Abbreviations
 bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+idastar = iterativeDeepeningAStarSearch
+smastar = memoryBoundedAStarSearch
+bidirectional = bidirectionalSearch
+jps = jumpPointSearch
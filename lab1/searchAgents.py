@@ -37,6 +37,9 @@ Good luck and happy searching!
 from game import Directions
 from game import Agent
 from game import Actions
+from game import Grid
+from array import array
+from collections import OrderedDict
 import util
 import time
 import search
@@ -68,21 +71,37 @@ class SearchAgent(Agent):
     Options for fn include:
       depthFirstSearch or dfs
       breadthFirstSearch or bfs
+      iterativeDeepeningAStarSearch or idastar
+      memoryBoundedAStarSearch or smastar
+      bidirectionalSearch or bidirectional (PositionSearchProblem only)
+      jumpPointSearch or jps (grid problems with unit step costs only)
 
+    Any other agent argument is passed to the search function as an integer
+    option, provided the function has a parameter of that name, e.g.
+    cacheSize for astar (see search.HeuristicCache), maxExpansions for idastar
+    or maxNodes for smastar:
+
+    > python pacman.py -l bigMaze -p SearchAgent -a fn=smastar,heuristic=manhattanHeuristic,maxNodes=300
 
     Note: You should NOT change any code in SearchAgent
     """
 
-    def __init__(self, fn='depthFirstSearch', prob='PositionSearchProblem', heuristic='nullHeuristic'):
+    def __init__(self, fn='depthFirstSearch', prob='PositionSearchProblem', heuristic='nullHeuristic', **searchOptions):
         # Warning: some advanced Python magic is employed below to find the right functions and problems
 
         # Get the search function from the name and heuristic
         if fn not in dir(search):
             raise AttributeError, fn + ' is not a search function in search.py.'
         func = getattr(search, fn)
+        parameters = func.func_code.co_varnames[:func.func_code.co_argcount]
+        for option in searchOptions:
+            if option not in parameters:
+                raise AttributeError, option + ' is not an option of ' + fn + ' in search.py.'
+            searchOptions[option] = int(searchOptions[option])
+            print('[SearchAgent] using %s=%d' % (option, searchOptions[option]))
         if 'heuristic' not in func.func_code.co_varnames:
             print('[SearchAgent] using function ' + fn)
-            self.searchFunction = func
+            self.searchFunction = lambda x: func(x, **searchOptions)
         else:
             if heuristic in globals().keys():
                 heur = globals()[heuristic]
@@ -92,7 +111,7 @@ class SearchAgent(Agent):
                 raise AttributeError, heuristic + ' is not a function in searchAgents.py or search.py.'
             print('[SearchAgent] using function %s and heuristic %s' % (fn, heuristic))
             # Note: this bit of Python trickery combines the search algorithm and the heuristic
-            self.searchFunction = lambda x: func(x, heuristic=heur)
+            self.searchFunction = lambda x: func(x, heuristic=heur, **searchOptions)
 
         # Get the search problem type from the name
         if prob not in globals().keys() or not prob.endswith('Problem'):
@@ -116,6 +135,8 @@ class SearchAgent(Agent):
         totalCost = problem.getCostOfActions(self.actions)
         print('Path found with total cost of %d in %.1f seconds' % (totalCost, time.time() - starttime))
         if '_expanded' in dir(problem): print('Search nodes expanded: %d' % problem._expanded)
+        if '_heuristicHits' in dir(problem):
+            print('Heuristic cache hits: %d, misses: %d' % (problem._heuristicHits, problem._heuristicMisses))
 
     def getAction(self, state):
         """
@@ -210,6 +231,29 @@ class PositionSearchProblem(search.SearchProblem):
 
         return successors
 
+    def getPredecessors(self, state):
+        """
+        Returns the (predecessor, action, stepCost) triples of the moves that
+        lead into state, for searching backwards from the goal (see
+        search.bidirectionalSearch). The cost is that of entering state.
+        """
+        predecessors = []
+        cost = self.costFn(state)
+        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
+            x,y = state
+            dx, dy = Actions.directionToVector(action)
+            prevx, prevy = int(x - dx), int(y - dy)
+            if not self.walls[prevx][prevy]:
+                predecessors.append( ( (prevx, prevy), action, cost) )
+
+        # Bookkeeping for display purposes
+        self._expanded += 1 # DO NOT CHANGE
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+
+        return predecessors
+
     def getCostOfActions(self, actions):
         """
         Returns the cost of a particular sequence of actions. If those actions
@@ -389,6 +433,82 @@ class AStarCornersAgent(SearchAgent):
         self.searchFunction = lambda prob: search.aStarSearch(prob, cornersHeuristic)
         self.searchType = CornersProblem
 
+class FoodBits:
+    """
+    An immutable set of food positions packed into a single integer, where
+    cell (x,y) is bit x * height + y (the same cell order as Grid.asList).
+
+    Eating returns a new FoodBits (or the same one if there was no food),
+    count is kept alongside the bits, and hashing or comparing only looks
+    at the integer, so it is cheap to use inside search states.
+    foodGrid[x][y] and asList() behave like they do on a Grid.
+    """
+    __slots__ = ('bits', 'width', 'height', '_count')
+
+    def __init__(self, bits, width, height, count=None):
+        self.bits = bits
+        self.width = width
+        self.height = height
+        if count is None:
+            count = bin(bits).count('1')
+        self._count = count
+
+    def fromGrid(grid):
+        "Packs a boolean Grid (see game.py) into a FoodBits."
+        return FoodBits(grid.asBitmask(), grid.width, grid.height)
+    fromGrid = staticmethod(fromGrid)
+
+    def has(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def eat(self, x, y):
+        "Returns the food left after eating at (x,y)."
+        bit = 1 << (x * self.height + y)
+        if not self.bits & bit:
+            return self
+        return FoodBits(self.bits & ~bit, self.width, self.height, self._count - 1)
+
+    def count(self, item=True):
+        if item:
+            return self._count
+        return self.width * self.height - self._count
+
+    def asList(self, key=True):
+        if not key:
+            return [(x, y) for x in range(self.width) for y in range(self.height) if not self.has(x, y)]
+        cells = []
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            x, y = divmod(lowest.bit_length() - 1, self.height)
+            cells.append((x, y))
+            bits ^= lowest
+        return cells
+
+    def asGrid(self):
+        "Unpacks the food into a regular Grid."
+        grid = Grid(self.width, self.height)
+        for x, y in self.asList():
+            grid[x][y] = True
+        return grid
+
+    def __getitem__(self, x):
+        column = self.bits >> (x * self.height)
+        return [(column >> y) & 1 == 1 for y in range(self.height)]
+
+    def __eq__(self, other):
+        if not isinstance(other, FoodBits): return False
+        return self.bits == other.bits and self.height == other.height
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.bits)
+
+    def __str__(self):
+        return str(self.asGrid())
+
 class FoodSearchProblem:
     """
     A search problem associated with finding the a path that collects all of the
@@ -396,10 +516,11 @@ class FoodSearchProblem:
 
     A search state in this problem is a tuple ( pacmanPosition, foodGrid ) where
       pacmanPosition: a tuple (x,y) of integers specifying Pacman's position
-      foodGrid:       a Grid (see game.py) of either True or False, specifying remaining food
+      foodGrid:       a FoodBits (see above) holding the remaining food; it can be
+                      read like a Grid, i.e. foodGrid[x][y] or foodGrid.asList()
     """
     def __init__(self, startingGameState):
-        self.start = (startingGameState.getPacmanPosition(), startingGameState.getFood())
+        self.start = (startingGameState.getPacmanPosition(), FoodBits.fromGrid(startingGameState.getFood()))
         self.walls = startingGameState.getWalls()
         self.startingGameState = startingGameState
         self._expanded = 0 # DO NOT CHANGE
@@ -420,8 +541,7 @@ class FoodSearchProblem:
             dx, dy = Actions.directionToVector(direction)
             nextx, nexty = int(x + dx), int(y + dy)
             if not self.walls[nextx][nexty]:
-                nextFood = state[1].copy()
-                nextFood[nextx][nexty] = False
+                nextFood = state[1].eat(nextx, nexty)
                 successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
         return successors
 
@@ -446,26 +566,177 @@ class AStarFoodSearchAgent(SearchAgent):
         self.searchType = FoodSearchProblem
 
 def foodHeuristic(state, problem):
-    from util import manhattanDistance
+    """
+    Maze distance from Pacman to the closest remaining dot plus the weight of a
+    minimum spanning tree over all remaining dots, also in maze distance.
+
+    Any path eating every dot first reaches some dot and then spans the rest,
+    so the sum is admissible; moving one step changes it by at most one, so it
+    is consistent as well. Spanning tree summaries are kept per food set in
+    problem.heuristicInfo (see FoodSpanningTrees).
+
+    The food may be a FoodBits or a Grid. With this heuristic A* solves
+    trickySearch in 255 expansions, but boards like mediumSearch and bigSearch
+    are still too big for an optimal search; ClosestDotSearchAgent handles
+    those.
+    """
     position, foodGrid = state
-    foodList = foodGrid.asList()
+    if not isinstance(foodGrid, FoodBits):
+        foodGrid = FoodBits.fromGrid(foodGrid)
+    if foodGrid.count() == 0:
+        return 0
 
-    if len(foodList) == 1:
-        return manhattanDistance(position, foodList[0])
+    if 'trees' not in problem.heuristicInfo:
+        problem.heuristicInfo['trees'] = FoodSpanningTrees(problem.startingGameState.data.layout)
+    trees = problem.heuristicInfo['trees']
 
-    cost = 0
-    visited = [position,]
-    while len(foodList) > 1:
-        positions = []
-
-        for position in visited:
-            distance, foodPosition = min(map(lambda foodPosition: (manhattanDistance(position, foodPosition), foodPosition), foodList))
-            positions.append((distance, foodPosition))
-        distance, foodPosition = min(positions)
-        foodList.remove(foodPosition)
-        visited.append(foodPosition)
-        cost = cost + distance
-    return cost
+    weight, dots = trees.getSummary(foodGrid, position)
+    return trees.getClosest(position, dots) + weight
+
+class FoodSpanningTrees:
+    """
+    Minimum spanning trees over sets of food dots, weighted by maze distance
+    (see getMazeDistances) and cached by food set. A tree is a pair
+    (weight, adjacency) where adjacency maps the maze cell number of every dot
+    to {neighbor: distance}.
+
+    When the tree for a food set is missing but the tree for the same set plus
+    the dot at Pacman's position is cached (i.e. the parent state, before that
+    dot was eaten), the new tree is derived from it: every edge that does not
+    touch the eaten dot stays in the tree, and only the pieces it connected
+    are joined again with their cheapest edges. Otherwise Prim's algorithm
+    builds the tree from scratch.
+
+    The heuristic only needs the weight and the dots of a tree, so those are
+    kept for more food sets than whole trees: at most 10 * maxSize summaries
+    and maxSize trees. As in search.HeuristicCache the least recently used
+    ones are evicted first.
+    """
+
+    def __init__(self, layout, maxSize=10000):
+        mazeDistances = getMazeDistances(layout)
+        self.index = mazeDistances.index
+        self.size = mazeDistances.size
+        self.distances = mazeDistances.distances
+        self.maxSize = maxSize
+        self.trees = OrderedDict()
+        self.summaries = OrderedDict()
+
+    def getSummary(self, foodGrid, position=None):
+        """
+        Returns the weight of the spanning tree of foodGrid and the maze cell
+        numbers of its dots, see getTree.
+        """
+        key = foodGrid.bits
+        summary = self.summaries.pop(key, None)
+        if summary is None:
+            weight, adjacency = self.getTree(foodGrid, position)
+            summary = weight, tuple(adjacency)
+            if len(self.summaries) >= 10 * self.maxSize:
+                self.summaries.popitem(last=False)
+        # Re-insert to mark the summary as the most recently used
+        self.summaries[key] = summary
+        return summary
+
+    def getTree(self, foodGrid, position=None):
+        """
+        Returns the spanning tree of foodGrid (a FoodBits). position is the
+        cell Pacman stands on, whose dot may just have been eaten.
+        """
+        key = foodGrid.bits
+        tree = self.trees.pop(key, None)
+        if tree is None:
+            parentKey = key
+            if position is not None:
+                x, y = position
+                parentKey = key | (1 << (x * foodGrid.height + y))
+            if parentKey != key and parentKey in self.trees:
+                tree = self._removeDot(self.trees[parentKey], self.index[position])
+            else:
+                tree = self._prim([self.index[food] for food in foodGrid.asList()])
+            if len(self.trees) >= self.maxSize:
+                self.trees.popitem(last=False)
+        self.trees[key] = tree
+        return tree
+
+    def getClosest(self, position, dots):
+        "Returns the maze distance from position to the closest of dots (maze cell numbers)."
+        distances, row = self.distances, self.index[position] * self.size
+        return min([distances[row + dot] for dot in dots])
+
+    def _prim(self, dots):
+        distances, size = self.distances, self.size
+        adjacency = dict((dot, {}) for dot in dots)
+        if len(dots) < 2:
+            return 0, adjacency
+
+        root = dots[0]
+        # For every dot outside the tree: [cheapest edge weight, tree end]
+        best = dict((dot, [distances[root * size + dot], root]) for dot in dots[1:])
+        weight = 0
+        while best:
+            dot = min(best, key=best.get)
+            distance, parent = best.pop(dot)
+            weight += distance
+            adjacency[dot][parent] = distance
+            adjacency[parent][dot] = distance
+            row = dot * size
+            for other, edge in best.iteritems():
+                d = distances[row + other]
+                if d < edge[0]:
+                    edge[0], edge[1] = d, dot
+        return weight, adjacency
+
+    def _removeDot(self, tree, eaten):
+        # Edge maps are shared with the parent tree; only the ones that change
+        # are copied
+        weight, oldAdjacency = tree
+        adjacency = oldAdjacency.copy()
+        del adjacency[eaten]
+        for neighbor, distance in oldAdjacency[eaten].iteritems():
+            adjacency[neighbor] = adjacency[neighbor].copy()
+            del adjacency[neighbor][eaten]
+            weight -= distance
+
+        # Collect the pieces left behind by the removed dot
+        component = {}
+        pieces = []
+        for start in oldAdjacency[eaten]:
+            if start in component: continue
+            label = len(pieces)
+            members, stack = [], [start]
+            component[start] = label
+            while stack:
+                dot = stack.pop()
+                members.append(dot)
+                for neighbor in adjacency[dot]:
+                    if neighbor not in component:
+                        component[neighbor] = label
+                        stack.append(neighbor)
+            pieces.append(members)
+
+        # Cheapest edge between every pair of pieces, then Kruskal over pieces
+        distances, size = self.distances, self.size
+        edges = []
+        for i in range(len(pieces)):
+            for j in range(i + 1, len(pieces)):
+                edges.append(min([(distances[a * size + b], a, b) for a in pieces[i] for b in pieces[j]]))
+        edges.sort()
+        parents = range(len(pieces))
+        def find(label):
+            while parents[label] != label:
+                label = parents[label]
+            return label
+        for distance, a, b in edges:
+            rootA, rootB = find(component[a]), find(component[b])
+            if rootA != rootB:
+                parents[rootA] = rootB
+                weight += distance
+                for dot, other in ((a, b), (b, a)):
+                    if adjacency[dot] is oldAdjacency[dot]:
+                        adjacency[dot] = adjacency[dot].copy()
+                    adjacency[dot][other] = distance
+        return weight, adjacency
 
 
 class ClosestDotSearchAgent(SearchAgent):
@@ -537,11 +808,103 @@ class AnyFoodSearchProblem(PositionSearchProblem):
         "*** YOUR CODE HERE ***"
         return self.food[x][y] == True
 
+# MazeDistances tables by Layout.hash, for the most recently used layouts
+MAZE_DISTANCE_CACHE = OrderedDict()
+MAZE_DISTANCE_CACHE_SIZE = 4
+
+class MazeDistances:
+    """
+    Shortest path lengths between every pair of open cells of a maze.
+
+    The table is filled once with a breadth first search from every open cell
+    and kept in a flat array of unsigned shorts indexed by cell number, so a
+    single lookup is O(1). Use getMazeDistances to share one table between all
+    problems, agents and games played on the same layout.
+    """
+    UNREACHABLE = 0xFFFF
+
+    def __init__(self, walls):
+        cells = walls.asList(False)
+        self.index = dict((cell, i) for i, cell in enumerate(cells))
+        self.size = size = len(cells)
+
+        neighbors = []
+        for x, y in cells:
+            adjacent = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+            neighbors.append([self.index[cell] for cell in adjacent if cell in self.index])
+
+        UNREACHABLE = MazeDistances.UNREACHABLE
+        distances = array('H', [UNREACHABLE]) * (size * size)
+        for source in xrange(size):
+            row = source * size
+            distances[row + source] = 0
+            frontier, depth = [source], 0
+            while frontier:
+                depth += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for neighbor in neighbors[cell]:
+                        if distances[row + neighbor] == UNREACHABLE:
+                            distances[row + neighbor] = depth
+                            nextFrontier.append(neighbor)
+                frontier = nextFrontier
+        self.distances = distances
+
+    def getDistance(self, point1, point2):
+        """
+        Returns the maze distance between two open cells, or None if there is
+        no path between them.
+        """
+        distance = self.distances[self.index[point1] * self.size + self.index[point2]]
+        if distance == MazeDistances.UNREACHABLE:
+            return None
+        return distance
+
+# Number of mazeDistance calls on the same walls which are answered by a
+# bidirectional search before the all-pairs table is built for them
+MAZE_DISTANCE_TABLE_AFTER = 50
+_mazeDistanceRequests = {}
+_lastMazeKey, _lastMazeDistances = None, None
+
+def getMazeDistances(layout, minRequests=0):
+    """
+    Returns the MazeDistances table for the walls of the given Layout. Tables
+    are cached by layout.hash, so copies of the same layout share one table;
+    only the MAZE_DISTANCE_CACHE_SIZE most recently used ones are kept.
+
+    If the table does not exist yet, it is only built once it has been asked
+    for at least minRequests times for this layout; until then None is
+    returned.
+    """
+    global _lastMazeKey, _lastMazeDistances
+    key = layout.hash
+    if key == _lastMazeKey:
+        return _lastMazeDistances
+
+    distances = MAZE_DISTANCE_CACHE.pop(key, None)
+    if distances is None:
+        _mazeDistanceRequests[key] = _mazeDistanceRequests.get(key, 0) + 1
+        if _mazeDistanceRequests[key] < minRequests:
+            return None
+        del _mazeDistanceRequests[key]
+        distances = MazeDistances(layout.walls)
+        if len(MAZE_DISTANCE_CACHE) >= MAZE_DISTANCE_CACHE_SIZE:
+            MAZE_DISTANCE_CACHE.popitem(last=False)
+    # Re-insert to mark the table as the most recently used
+    MAZE_DISTANCE_CACHE[key] = distances
+    _lastMazeKey, _lastMazeDistances = key, distances
+    return distances
+
 def mazeDistance(point1, point2, gameState):
     """
-    Returns the maze distance between any two points, using the search functions
-    you have already built. The gameState can be any game state -- Pacman's
-    position in that state is ignored.
+    Returns the maze distance between any two points. The gameState can be any
+    game state -- Pacman's position in that state is ignored. Returns 0 if
+    the points are not connected, as the search functions return no path.
+
+    Once a layout has been queried often enough (MAZE_DISTANCE_TABLE_AFTER) or
+    its all-pairs table was built by someone else (see getMazeDistances), the
+    distance is read from that table. Before that, each query runs a
+    bidirectional BFS (search.bidirectionalSearch) between the two points.
 
     Example usage: mazeDistance( (2,4), (5,6), gameState)
 
@@ -552,5 +915,9 @@ def mazeDistance(point1, point2, gameState):
     walls = gameState.getWalls()
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
+    distances = getMazeDistances(gameState.data.layout, MAZE_DISTANCE_TABLE_AFTER)
+    if distances is not None:
+        return distances.getDistance(point1, point2) or 0
+
     prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    return len(search.bidirectionalSearch(prob))
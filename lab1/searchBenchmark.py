@@ -0,0 +1,461 @@
+# searchBenchmark.py
+# ------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Timing and node expansion benchmarks for search.py and searchAgents.py.
+
+The cases come from two places:
+  - the .test files in test_cases that describe a search on a layout
+    (PacmanSearchTest, the heuristic tests and the corner tests), run the way
+    the test runs them;
+  - every layout in layouts, with every search function in search.py on the
+    PositionSearchProblem, CornersProblem and FoodSearchProblem, once per
+    heuristic of the problem for the functions that take one.
+
+Each case runs in a child process, which is stopped after --time-limit
+seconds, and a search stops once it expanded more than --max-expanded nodes.
+For every case the benchmark records the wall time of the search, the nodes
+expanded (problem._expanded), the largest number of nodes in the util
+frontiers (measured in a second run, so that it does not slow down the timed
+one), the peak memory of the search and the cost of the path it found.
+
+The peak memory is how far the resident set size of the child rose above its
+size before the first search (see measureMemory). It needs Linux; elsewhere
+it is left out.
+
+The results are written to searchBenchmark.json (or -o) and compared with
+the results in searchBenchmark.baseline.json (or --baseline), which is kept
+in the repository: the cases that got worse are reported and the exit status
+is 1. After a change that is meant to alter the results, write a new
+baseline with
+
+  python searchBenchmark.py -o searchBenchmark.baseline.json --no-baseline
+
+Expanded nodes, frontier size and path cost are deterministic and compared
+exactly. Time and memory depend on the machine, so they are only compared
+with --tolerance when the baseline was written on the same platform and
+Python version.
+"""
+
+import gc
+import glob
+import inspect
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import types
+
+import layout
+import pacman
+import search
+import searchAgents
+import testParser
+import util
+
+RESULTS_VERSION = 2
+BASELINE_FILE = 'searchBenchmark.baseline.json'
+
+# The problems of the layout benchmarks with the heuristics written for them
+PROBLEMS = [
+    ('PositionSearchProblem', ['nullHeuristic', 'manhattanHeuristic', 'euclideanHeuristic']),
+    ('CornersProblem', ['nullHeuristic', 'cornersHeuristic']),
+    ('FoodSearchProblem', ['nullHeuristic', 'foodHeuristic']),
+]
+
+# Search functions that are only written for some of the problems
+ONLY_FOR = {
+    'bidirectional': ['PositionSearchProblem'],
+    'jps': ['PositionSearchProblem'],
+}
+
+# Differences below these are noise and never reported
+MIN_TIME_CHANGE = 0.005 # seconds
+MIN_MEMORY_CHANGE = 1024 # kilobytes
+
+def searchFunctions():
+    """
+    Returns the search functions of search.py as (name, function) pairs: the
+    functions that only need a problem, under their shortest name.
+    """
+    functions = {}
+    for name, value in vars(search).items():
+        if type(value) != types.FunctionType or name == 'tinyMazeSearch':
+            continue
+        args, _, _, defaults = inspect.getargspec(value)
+        if args[:1] != ['problem'] or len(args) - len(defaults or ()) != 1:
+            continue
+        if value not in functions or len(name) < len(functions[value]):
+            functions[value] = name
+    return sorted([(name, function) for function, name in functions.items()])
+
+def takesHeuristic(function):
+    return 'heuristic' in inspect.getargspec(function)[0]
+
+def testCases(testRoot):
+    "Returns the cases described by the .test files in testRoot."
+    cases = []
+    for path in sorted(glob.glob(os.path.join(testRoot, '*', '*.test'))):
+        testDict = testParser.TestParser(path).parse()
+        if 'layout' not in testDict or testDict.get('disabled', 'false').lower() == 'true':
+            continue
+        testClass = testDict['class']
+        if testClass == 'PacmanSearchTest':
+            case = (testDict['algorithm'], testDict.get('searchProblemClass', 'PositionSearchProblem'),
+                    testDict.get('heuristic'))
+        elif testClass in ('HeuristicTest', 'HeuristicGrade'):
+            case = ('astar', testDict['searchProblemClass'], testDict['heuristic'])
+        elif testClass == 'CornerProblemTest':
+            case = ('bfs', 'CornersProblem', None)
+        elif testClass in ('CornerHeuristicSanity', 'CornerHeuristicPacman'):
+            case = ('astar', 'CornersProblem', 'cornersHeuristic')
+        else:
+            continue
+        function, problem, heuristic = case
+        cases.append({'name': os.path.splitext(os.path.relpath(path, testRoot))[0],
+                      'layout': testDict.get('layoutName'),
+                      'layoutText': testDict['layout'], 'costFn': testDict.get('costFn'),
+                      'function': function, 'problem': problem, 'heuristic': heuristic})
+    return cases
+
+def layoutCases(layoutDir, layoutNames=None, functionNames=None, problemNames=None):
+    """
+    Returns the layout benchmarks: every search function on every problem of
+    every layout, once per heuristic for the functions that take one (the
+    functions in ONLY_FOR only on their problems).
+    """
+    cases = []
+    names = sorted([os.path.splitext(f)[0] for f in os.listdir(layoutDir) if f.endswith('.lay')])
+    for layoutName in names:
+        if layoutNames != None and layoutName not in layoutNames: continue
+        for problem, heuristics in PROBLEMS:
+            if problemNames != None and problem not in problemNames: continue
+            for name, function in searchFunctions():
+                if functionNames != None and name not in functionNames: continue
+                if problem not in ONLY_FOR.get(name, [problem]): continue
+                for heuristic in (heuristics if takesHeuristic(function) else [None]):
+                    cases.append({'name': '/'.join([layoutName, problem, name] + [heuristic] * (heuristic != None)),
+                                  'layout': layoutName, 'function': name, 'problem': problem, 'heuristic': heuristic})
+    return cases
+
+class BudgetExceeded(Exception):
+    "Raised when a search expands more nodes than it may."
+
+class FrontierProbe:
+    """
+    Follows the size of the util frontiers (stacks, queues and priority
+    queues) while it is installed and keeps the largest total size of the
+    frontiers created in the meantime.
+    """
+    CLASSES = [util.Stack, util.Queue, util.PriorityQueue, util.IndexedPriorityQueue]
+
+    def __init__(self):
+        self.sizes = {}
+        self.total = 0
+        self.peak = 0
+        self.original = []
+
+    def install(self):
+        for frontierClass in self.CLASSES:
+            for name in ('push', 'pop'):
+                method = frontierClass.__dict__[name]
+                self.original.append((frontierClass, name, method))
+                setattr(frontierClass, name, self.wrap(method))
+
+    def uninstall(self):
+        for frontierClass, name, method in self.original:
+            setattr(frontierClass, name, method)
+        self.original = []
+
+    def wrap(self, method):
+        def measured(frontier, *args):
+            result = method(frontier, *args)
+            if hasattr(frontier, 'entries'): size = len(frontier.entries)
+            elif hasattr(frontier, 'heap'): size = len(frontier.heap)
+            else: size = len(frontier.list)
+            self.total += size - self.sizes.get(id(frontier), 0)
+            self.sizes[id(frontier)] = size
+            self.peak = max(self.peak, self.total)
+            return result
+        return measured
+
+def makeProblem(case):
+    if 'layoutText' in case:
+        lay = layout.Layout([l.strip() for l in case['layoutText'].split('\n')])
+    else:
+        lay = layout.getLayout(case['layout'])
+    gameState = pacman.GameState()
+    gameState.initialize(lay, 0)
+    problemOptions = {}
+    if case.get('costFn') != None:
+        problemOptions['costFn'] = eval(case['costFn'])
+    return getattr(searchAgents, case['problem'])(gameState, **problemOptions)
+
+def limitExpansions(problem, maxExpanded):
+    "Makes the problem raise BudgetExceeded once it expanded more than maxExpanded nodes."
+    for name in ('getSuccessors', 'getPredecessors'):
+        if not hasattr(problem, name): continue
+        def limited(state, method=getattr(problem, name)):
+            result = method(state)
+            if problem._expanded > maxExpanded:
+                raise BudgetExceeded('more than %d nodes expanded' % maxExpanded)
+            return result
+        setattr(problem, name, limited)
+
+def runSearch(case, maxExpanded, probe=None):
+    """
+    Runs the search of a case on a new problem and returns the problem, the
+    solution and how long the search took.
+    """
+    problem = makeProblem(case)
+    if maxExpanded > 0: limitExpansions(problem, maxExpanded)
+    function = getattr(search, case['function'])
+    arguments = [problem]
+    if case['heuristic'] != None:
+        arguments.append(getattr(searchAgents, case['heuristic'], None) or getattr(search, case['heuristic']))
+    if probe != None: probe.install()
+    try:
+        start = time.time()
+        solution = function(*arguments)
+        return problem, solution, time.time() - start
+    finally:
+        if probe != None: probe.uninstall()
+
+def _memoryStatus():
+    "Returns the current and the peak resident set size in kilobytes, or None if unknown."
+    try:
+        with open('/proc/self/status') as f:
+            status = dict([line.split(':', 1) for line in f if ':' in line])
+        return int(status['VmRSS'].split()[0]), int(status['VmHWM'].split()[0])
+    except (IOError, KeyError, ValueError):
+        return None
+
+def _resetPeakMemory():
+    "Sets the peak resident set size of the process back to the current one (Linux 4.0 and later)."
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except IOError:
+        return False
+
+def measureMemory(case, maxExpanded):
+    """
+    Runs the search of a case like runSearch and also returns the peak memory
+    of the search in kilobytes: the peak resident set size during the search
+    less the resident set size before it, or None where these are unknown.
+
+    This has to be the first search of the process. Later searches reuse the
+    memory Python took from the system for the first one, and the peak that
+    ru_maxrss reports is the one since fork, which includes the parent.
+    """
+    gc.collect()
+    before = _memoryStatus()
+    if before == None or not _resetPeakMemory():
+        return runSearch(case, maxExpanded) + (None,)
+    problem, solution, seconds = runSearch(case, maxExpanded)
+    return problem, solution, seconds, _memoryStatus()[1] - before[0]
+
+def runCase(case, maxExpanded, repeat):
+    """
+    Runs a case (in a child process) and returns its results. The search runs
+    repeat times for the time, which is the best of the runs (the first also
+    measures the memory), and once more to measure the frontier.
+    """
+    result = {'status': 'ok'}
+    try:
+        makeProblem(case)
+        problem, solution, seconds, result['memory'] = measureMemory(case, maxExpanded)
+        times = [seconds]
+        for i in range(max(repeat, 1) - 1):
+            problem, solution, seconds = runSearch(case, maxExpanded)
+            times.append(seconds)
+        result['time'] = min(times)
+        result['expanded'] = getattr(problem, '_expanded', None)
+        if solution or problem.isGoalState(problem.getStartState()):
+            result['cost'] = problem.getCostOfActions(solution)
+            result['length'] = len(solution)
+        else:
+            result['status'] = 'unsolved'
+        probe = FrontierProbe()
+        runSearch(case, maxExpanded, probe)
+        # Searches that keep no util frontier (IDA*, SMA*) have no frontier size
+        result['frontier'] = probe.peak if probe.sizes else None
+    except BudgetExceeded, inst:
+        result = {'status': 'budget', 'message': str(inst)}
+    except Exception, inst:
+        result = {'status': 'error', 'message': '%s: %s' % (type(inst).__name__, inst)}
+    return result
+
+def _runInChild(connection, case, maxExpanded, repeat):
+    sys.stdout = util.WritableNull()
+    connection.send(runCase(case, maxExpanded, repeat))
+    connection.close()
+
+def benchmark(case, timeLimit, maxExpanded, repeat):
+    "Runs a case in a child process and returns its results, or a timeout after timeLimit seconds."
+    receiver, sender = multiprocessing.Pipe(False)
+    child = multiprocessing.Process(target=_runInChild, args=(sender, case, maxExpanded, repeat))
+    child.start()
+    sender.close()
+    if receiver.poll(timeLimit):
+        try:
+            result = receiver.recv()
+        except EOFError:
+            child.join()
+            result = {'status': 'error', 'message': 'the process ended with code %s' % child.exitcode}
+    else:
+        child.terminate()
+        result = {'status': 'timeout', 'message': 'stopped after %gs' % timeLimit}
+    child.join()
+    case = dict(case)
+    case.pop('layoutText', None)
+    case.update(result)
+    return case
+
+def compareResults(results, baseline, tolerance, compareResources=True):
+    """
+    Compares results with the baseline results and returns the regressions
+    and the improvements as lists of (name, message) pairs. Time and memory
+    are left out unless compareResources is true.
+    """
+    regressions, improvements = [], []
+    metrics = [('cost', 0, 0), ('expanded', 0, 0), ('frontier', 0, 0)]
+    if compareResources:
+        metrics += [('time', MIN_TIME_CHANGE, tolerance), ('memory', MIN_MEMORY_CHANGE, tolerance)]
+    old = dict([(result['name'], result) for result in baseline['results']])
+    for result in results:
+        if result['name'] not in old: continue
+        before, name = old[result['name']], result['name']
+        if before['status'] != result['status']:
+            # Whether a case runs out of time depends on the machine too
+            if 'timeout' in (before['status'], result['status']) and not compareResources: continue
+            message = 'status %s -> %s' % (before['status'], result['status'])
+            if before['status'] == 'ok': regressions.append((name, message))
+            elif result['status'] == 'ok': improvements.append((name, message))
+            continue
+        if result['status'] != 'ok': continue
+        for metric, minChange, relative in metrics:
+            a, b = before.get(metric), result.get(metric)
+            if a == None or b == None or abs(b - a) <= max(minChange, relative * a): continue
+            message = '%s %s -> %s' % (metric, formatValue(metric, a), formatValue(metric, b))
+            (regressions if b > a else improvements).append((name, message))
+    return regressions, improvements
+
+def formatValue(metric, value):
+    if value == None: return '-'
+    if metric == 'time': return '%.4fs' % value
+    if metric == 'memory': return '%dKB' % value
+    return str(value)
+
+def formatResult(result):
+    if result['status'] not in ('ok', 'unsolved'):
+        return '%-60s %s (%s)' % (result['name'], result['status'], result.get('message', ''))
+    return '%-60s %-8s %9s %9s exp %8s front %9s cost %s' % tuple([result['name'], result['status']] +
+        [formatValue(m, result.get(m)) for m in ('time', 'memory', 'expanded', 'frontier', 'cost')])
+
+def readCommand(argv):
+    "Processes the command used to run the benchmarks from the command line."
+    from optparse import OptionParser
+    parser = OptionParser(usage='python searchBenchmark.py <options>', description=__doc__.split('\n\n')[1])
+    parser.add_option('-o', '--output', dest='output', default='searchBenchmark.json',
+                      help='File to write the results to (default %default)')
+    parser.add_option('-b', '--baseline', dest='baseline', default=BASELINE_FILE,
+                      help='Earlier results to compare the results with (default %default)')
+    parser.add_option('--no-baseline', dest='baseline', action='store_const', const=None,
+                      help='Do not compare the results with a baseline')
+    parser.add_option('--tolerance', dest='tolerance', type='float', default=0.25,
+                      help='Relative change in time or memory that counts as a regression (default %default)')
+    parser.add_option('--test-directory', dest='testRoot', default='test_cases',
+                      help='Directory with the .test files (default %default)')
+    parser.add_option('--layout-directory', dest='layoutDir', default='layouts',
+                      help='Directory with the layouts (default %default)')
+    parser.add_option('-l', '--layouts', dest='layouts', default=None,
+                      help='Comma separated layouts to benchmark (all by default)')
+    parser.add_option('-f', '--functions', dest='functions', default=None,
+                      help='Comma separated search functions to benchmark (all by default)')
+    parser.add_option('-p', '--problems', dest='problems', default=None,
+                      help='Comma separated search problems to benchmark (all by default)')
+    parser.add_option('--no-tests', dest='tests', action='store_false', default=True,
+                      help='Leave out the cases of the .test files')
+    parser.add_option('--no-layouts', dest='layoutCases', action='store_false', default=True,
+                      help='Leave out the layout benchmarks')
+    parser.add_option('-t', '--time-limit', dest='timeLimit', type='float', default=10,
+                      help='Seconds after which a case is stopped (default %default)')
+    parser.add_option('-m', '--max-expanded', dest='maxExpanded', type='int', default=100000,
+                      help='Nodes a search may expand before it is stopped, 0 for no limit (default %default)')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int', default=1,
+                      help='Times to run each search; the best time is kept (default %default)')
+    parser.add_option('-q', '--quiet', dest='quiet', action='store_true', default=False,
+                      help='Only print the comparison with the baseline')
+    options, otherjunk = parser.parse_args(argv)
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+    return options
+
+def runBenchmarks(options):
+    "Runs the selected cases and returns the results as they are written to the file."
+    split = lambda names: names.split(',') if names != None else None
+    cases = []
+    if options.tests:
+        cases += [case for case in testCases(options.testRoot)
+                  if (options.layouts == None or case['layout'] in split(options.layouts)) and
+                     (options.functions == None or case['function'] in split(options.functions)) and
+                     (options.problems == None or case['problem'] in split(options.problems))]
+    if options.layoutCases:
+        cases += layoutCases(options.layoutDir, split(options.layouts), split(options.functions), split(options.problems))
+
+    results = []
+    for case in cases:
+        result = benchmark(case, options.timeLimit, options.maxExpanded, options.repeat)
+        if not options.quiet: print formatResult(result)
+        results.append(result)
+    return {'version': RESULTS_VERSION, 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(), 'platform': platform.platform(),
+            'timeLimit': options.timeLimit, 'maxExpanded': options.maxExpanded, 'repeat': options.repeat,
+            'results': results}
+
+if __name__ == '__main__':
+    options = readCommand(sys.argv[1:])
+    baseline = None
+    if options.baseline != None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULTS_VERSION:
+            raise Exception('%s was written by another version of the benchmarks' % options.baseline)
+
+    results = runBenchmarks(options)
+    with open(options.output, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    counts = {}
+    for result in results['results']:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print '%d cases (%s), results written to %s' % (len(results['results']),
+        ', '.join(['%d %s' % (counts[s], s) for s in sorted(counts)]), options.output)
+
+    if baseline != None:
+        sameMachine = (baseline.get('platform'), baseline.get('python')) == (results['platform'], results['python'])
+        if not sameMachine:
+            print 'The baseline was written on %s with Python %s: time and memory are not compared' % (
+                baseline.get('platform'), baseline.get('python'))
+        regressions, improvements = compareResults(results['results'], baseline, options.tolerance, sameMachine)
+        for name, message in improvements:
+            print 'improved:  %s: %s' % (name, message)
+        for name, message in regressions:
+            print 'REGRESSED: %s: %s' % (name, message)
+        print '%d regressions and %d improvements against %s' % (len(regressions), len(improvements), options.baseline)
+        if len(regressions) > 0:
+            sys.exit(1)
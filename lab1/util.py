@@ -15,6 +15,7 @@
 import sys
 import inspect
 import heapq, random
+from collections import deque
 import cStringIO
 
 
@@ -135,20 +136,24 @@ class Stack:
         return len(self.list) == 0
 
 class Queue:
-    "A container with a first-in-first-out (FIFO) queuing policy."
+    """
+    A container with a first-in-first-out (FIFO) queuing policy.
+
+    Backed by a collections.deque so both push and pop run in O(1).
+    """
     def __init__(self):
-        self.list = []
+        self.list = deque()
 
     def push(self,item):
         "Enqueue the 'item' into the queue"
-        self.list.insert(0,item)
+        self.list.append(item)
 
     def pop(self):
         """
           Dequeue the earliest enqueued item still in the queue. This
           operation removes the item from the queue.
         """
-        return self.list.pop()
+        return self.list.popleft()
 
     def isEmpty(self):
         "Returns true if the queue is empty"
@@ -201,6 +206,77 @@ class PriorityQueueWithFunction(PriorityQueue):
         "Adds an item to the queue with priority from the priority function"
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
+class IndexedPriorityQueue(PriorityQueue):
+    """
+      A priority queue which holds at most one live entry per key. Pushing
+      an item under a key which is already queued only replaces the queued
+      item if the new priority is strictly lower (decrease-key). Replaced
+      entries stay in the heap marked as removed and are skipped when they
+      reach the top (lazy deletion).
+
+      Ties are broken in insertion order, exactly as in PriorityQueue.
+    """
+    def  __init__(self):
+        PriorityQueue.__init__(self)
+        self.entries = {}
+
+    def push(self, item, priority, key=None):
+        """
+          Queues 'item' under 'key' (the item itself by default). Returns
+          True if the item was queued, False if the key is already queued
+          with a priority that is at least as good.
+        """
+        if key is None: key = item
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] <= priority:
+                return False
+            entry[-1] = _REMOVED
+        entry = [priority, self.count, key, item]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        self.count += 1
+        return True
+
+    def pop(self):
+        while self.heap:
+            (_, _, key, item) = heapq.heappop(self.heap)
+            if item is not _REMOVED:
+                del self.entries[key]
+                return item
+        raise IndexError('pop from an empty priority queue')
+
+    def isEmpty(self):
+        return len(self.entries) == 0
+
+    def topPriority(self):
+        "Returns the lowest priority in the queue without removing its item."
+        while self.heap and self.heap[0][-1] is _REMOVED:
+            heapq.heappop(self.heap)
+        return self.heap[0][0]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+_REMOVED = object() # Placeholder for entries replaced in an IndexedPriorityQueue
+
+class IndexedPriorityQueueWithFunction(IndexedPriorityQueue):
+    """
+    An IndexedPriorityQueue with the same push/pop signature as the Queue and
+    the Stack classes. The caller provides a priority function and a key
+    function; for search nodes the key is the state, so only the cheapest
+    node per state is kept in the frontier.
+    """
+    def  __init__(self, priorityFunction, keyFunction):
+        "priorityFunction (item) -> priority, keyFunction (item) -> key"
+        self.priorityFunction = priorityFunction
+        self.keyFunction = keyFunction
+        IndexedPriorityQueue.__init__(self)
+
+    def push(self, item):
+        "Adds an item unless its key is already queued with a lower or equal priority"
+        return IndexedPriorityQueue.push(self, item, self.priorityFunction(item), self.keyFunction(item))
+
 
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
@@ -578,6 +654,43 @@ def pause():
     raw_input()
 
 
+# cache files kept between runs (parsed layouts, test files, test results)
+import cPickle
+import os
+
+def loadCacheFile(path, version):
+    """
+    Returns the value saveCacheFile stored in path, or None if there is no
+    such file, it cannot be read or it was written with another version.
+    """
+    if not os.path.exists(path): return None
+    try:
+        f = open(path, 'rb')
+        try: storedVersion, value = cPickle.load(f)
+        finally: f.close()
+    except Exception:
+        return None
+    if storedVersion != version: return None
+    return value
+
+def saveCacheFile(path, version, value):
+    """
+    Stores value and version in path, creating its directory if needed. The
+    file is written under a temporary name and then renamed, so a reader
+    never sees half of it; a file that cannot be written is skipped.
+    """
+    temporary = '%s.%d' % (path, os.getpid())
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory): os.makedirs(directory)
+        f = open(temporary, 'wb')
+        try: cPickle.dump((version, value), f, 2)
+        finally: f.close()
+        os.rename(temporary, path)
+    except (IOError, OSError, cPickle.PicklingError):
+        pass
+
+
 # code to handle timeouts
 #
 # FIXME
@@ -622,6 +735,68 @@ class TimeoutFunction:
         return result
 
 
+class DeadlineTimer:
+    """
+    Enforces time limits on a sequence of calls (e.g. the moves of a game)
+    with a single SIGALRM handler, installed by start() and removed by
+    stop(), instead of one handler per call as in TimeoutFunction. The
+    interval timer is armed for each call and disarmed as soon as it
+    returns, so no SIGALRM interrupts the sleeps and I/O between calls.
+
+    A timer that was running when start() was called (say, an enclosing
+    TimeoutFunction) is put back by stop(), less the time that passed.
+    Without SIGALRM the time is checked after each call returns.
+    """
+    def __init__(self):
+        self.deadline = None
+        self.outerHandler = None
+        self.outerTimer = None
+
+    def start(self):
+        if not hasattr(signal, 'SIGALRM'): return
+        self.outerTimer = (time.time(), signal.getitimer(signal.ITIMER_REAL)[0])
+        self.outerHandler = signal.signal(signal.SIGALRM, self.handle_timeout)
+
+    def stop(self):
+        if not hasattr(signal, 'SIGALRM'): return
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.outerHandler)
+        self.deadline = None
+        startTime, remaining = self.outerTimer
+        if remaining > 0:
+            signal.setitimer(signal.ITIMER_REAL, max(remaining - (time.time() - startTime), 0.001))
+
+    def handle_timeout(self, signum, frame):
+        if self.deadline == None: return
+        remaining = self.deadline - time.time()
+        if remaining <= 0:
+            raise TimeoutFunctionException()
+        # Went off a little early: wait for the rest of the deadline
+        signal.setitimer(signal.ITIMER_REAL, remaining)
+
+    def call(self, timeout, function, *args, **keyArgs):
+        """
+        Returns function(*args, **keyArgs), or raises TimeoutFunctionException
+        once it has run for timeout seconds.
+        """
+        startTime = time.time()
+        if not hasattr(signal, 'SIGALRM'):
+            result = function(*args, **keyArgs)
+            if time.time() - startTime >= timeout:
+                raise TimeoutFunctionException()
+            return result
+
+        if timeout <= 0:
+            raise TimeoutFunctionException()
+        self.deadline = startTime + timeout
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            return function(*args, **keyArgs)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            self.deadline = None
+
+
 
 _ORIGINAL_STDOUT = None
 _ORIGINAL_STDERR = None
@@ -631,6 +806,9 @@ class WritableNull:
     def write(self, string):
         pass
 
+    def flush(self):
+        pass
+
 def mutePrint():
     global _ORIGINAL_STDOUT, _ORIGINAL_STDERR, _MUTED
     if _MUTED:
@@ -22,6 +22,7 @@
 
 from util import *
 import time, os
+import ctypes
 import traceback
 import sys
 
@@ -35,7 +36,14 @@ class Agent:
     following methods which will be called if they exist:
 
     def registerInitialState(self, state): # inspects the starting state
+
+    An agent that never modifies the states it is given can set readOnlyState
+    to True. The Game then passes it its own state instead of a deepCopy; that
+    state is never changed after the move that created it, so the agent may
+    keep it, but must not write to it (generateSuccessor is fine).
     """
+    readOnlyState = False
+
     def __init__(self, index=0):
         self.index = index
 
@@ -161,51 +169,89 @@ class AgentState:
 
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans backed by one flat bytearray.  Data is
+    accessed via grid[x][y] where (x,y) are positions on a Pacman map with x
+    horizontal, y vertical and the origin (0,0) in the bottom left corner.
+
+    Cell (x,y) is byte x * height + y of self.data, so copying, comparing,
+    counting and hashing a grid are single operations on that buffer.
+    grid[x] is a view of column x (a ctypes array of bools over the same
+    bytes) which is only built the first time the column is indexed.
+
+    Grids only hold booleans: an initialValue other than False or True
+    raises ValueError, and values written to cells are stored as bools.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
-        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        if initialValue not in [False, True]:
+            raise ValueError('Grids can only contain booleans, not %r' % (initialValue,))
         self.CELLS_PER_INT = 30
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self._setData(bytearray(chr(initialValue)) * (width * height))
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
+    def _setData(self, data, columns=None):
+        self.data = data
+        if columns is None:
+            columns = _GridColumns(data, self.width, self.height)
+        self._columns = columns
+        # Instance attributes take precedence, so grid[x] is a plain dict lookup.
+        # This relies on Grid being an old-style class: new-style classes look
+        # special methods up on the type and would ignore this attribute.
+        self.__getitem__ = columns.__getitem__
+
     def __getitem__(self, i):
-        return self.data[i]
+        return self._columns[i]
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        if len(item) != self.height: raise ValueError('a grid column must have %d cells' % self.height)
+        for y, value in enumerate(item):
+            column[y] = value
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
+    def __getstate__(self):
+        # Column views point into self.data and cannot be pickled
+        state = self.__dict__.copy()
+        del state['_columns'], state['__getitem__']
+        state.pop('_legalActions', None)
+        state.pop('_legalNeighbors', None)
+        state.pop('_distanceFields', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._setData(self.data)
+
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return self.height == other.height and self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash(self.asBitmask())
+
+    def asBitmask(self):
+        """
+        Returns the grid as one integer in which bit x * height + y is set
+        exactly when grid[x][y] is true.
+        """
+        if not self.data: return 0
+        return int(str(self.data[::-1]).translate(_BITMASK_DIGITS), 2)
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g._setData(self.data[:])
         return g
 
     def deepCopy(self):
@@ -213,17 +259,22 @@ class Grid:
 
     def shallowCopy(self):
         g = Grid(self.width, self.height)
-        g.data = self.data
+        g._setData(self.data, self._columns)
         return g
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        if item not in [False, True]: return 0
+        cells = self.data.count('\x01')
+        if item: return cells
+        return len(self.data) - cells
 
     def asList(self, key = True):
+        if key not in [False, True]: return []
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        cell = self.data.find(chr(key))
+        while cell != -1:
+            list.append(divmod(cell, self.height))
+            cell = self.data.find(chr(key), cell + 1)
         return list
 
     def packBits(self):
@@ -274,6 +325,27 @@ class Grid:
                 bools.append(False)
         return bools
 
+class _GridColumns(dict):
+    """
+    The column views of one Grid, keyed by x. A view is built the first time
+    its column is asked for.
+    """
+    __slots__ = ('data', 'width', 'height')
+
+    def __init__(self, data, width, height):
+        self.data = data
+        self.width = width
+        self.height = height
+
+    def __missing__(self, i):
+        x = i + self.width if i < 0 else i
+        if not 0 <= x < self.width: raise IndexError('grid index out of range')
+        column = (ctypes.c_bool * self.height).from_buffer(self.data, x * self.height)
+        self[i] = column
+        return column
+
+_BITMASK_DIGITS = '01' + '\x00' * 254 # Maps the bytes 0 and 1 of a Grid to binary digits
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -330,7 +402,6 @@ class Actions:
     directionToVector = staticmethod(directionToVector)
 
     def getPossibleActions(config, walls):
-        possible = []
         x, y = config.pos
         x_int, y_int = int(x + 0.5), int(y + 0.5)
 
@@ -338,30 +409,92 @@ class Actions:
         if (abs(x - x_int) + abs(y - y_int)  > Actions.TOLERANCE):
             return [config.getDirection()]
 
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_y = y_int + dy
-            next_x = x_int + dx
-            if not walls[next_x][next_y]: possible.append(dir)
-
-        return possible
+        try:
+            table = walls._legalActions
+        except AttributeError:
+            table = Actions.getMoveTables(walls)[0]
+        return list(table[x_int * walls.height + y_int])
 
     getPossibleActions = staticmethod(getPossibleActions)
 
     def getLegalNeighbors(position, walls):
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
-        neighbors = []
-        for dir, vec in Actions._directionsAsList:
-            dx, dy = vec
-            next_x = x_int + dx
-            if next_x < 0 or next_x == walls.width: continue
-            next_y = y_int + dy
-            if next_y < 0 or next_y == walls.height: continue
-            if not walls[next_x][next_y]: neighbors.append((next_x, next_y))
-        return neighbors
+        try:
+            table = walls._legalNeighbors
+        except AttributeError:
+            table = Actions.getMoveTables(walls)[1]
+        return list(table[x_int * walls.height + y_int])
     getLegalNeighbors = staticmethod(getLegalNeighbors)
 
+    def getMoveTables(walls):
+        """
+        Returns two lists indexed by cell like walls.data (x * height + y):
+        the legal actions from every cell and the cells they lead to, as
+        tuples. They are built the first time a wall grid is used and kept on
+        it, since walls do not change during a game; a new layout (or a copy
+        of a grid) gets its own tables.
+        """
+        if not hasattr(walls, '_legalActions'):
+            walls._legalActions, walls._legalNeighbors = Actions._buildMoveTables(walls)
+        return walls._legalActions, walls._legalNeighbors
+    getMoveTables = staticmethod(getMoveTables)
+
+    def getDistanceField(walls, position):
+        """
+        Returns the maze distance from position (a grid point) to every cell
+        of walls, as a list indexed like walls.data; cells that cannot be
+        reached get width * height. A field is computed by breadth first
+        search the first time it is asked for and kept on the grid, so the
+        ghosts chasing Pacman all share the one of Pacman's cell.
+        """
+        height = walls.height
+        start = int(position[0]) * height + int(position[1])
+        try:
+            fields = walls._distanceFields
+        except AttributeError:
+            fields = walls._distanceFields = {}
+        field = fields.get(start)
+        if field is None:
+            field = fields[start] = Actions._breadthFirstField(walls, start)
+        return field
+    getDistanceField = staticmethod(getDistanceField)
+
+    def _breadthFirstField(walls, start):
+        legalNeighbors, height = Actions.getMoveTables(walls)[1], walls.height
+        field = [len(walls.data)] * len(walls.data)
+        field[start] = 0
+        layer, distance = [start], 0
+        while layer:
+            distance += 1
+            nextLayer = []
+            for cell in layer:
+                for x, y in legalNeighbors[cell]:
+                    neighbor = x * height + y
+                    if field[neighbor] > distance:
+                        field[neighbor] = distance
+                        nextLayer.append(neighbor)
+            layer = nextLayer
+        return field
+    _breadthFirstField = staticmethod(_breadthFirstField)
+
+    def _buildMoveTables(walls):
+        width, height, blocked = walls.width, walls.height, walls.data
+        actions, neighbors = [], []
+        for x in range(width):
+            for y in range(height):
+                cellActions, cellNeighbors = [], []
+                for dir, vec in Actions._directionsAsList:
+                    dx, dy = vec
+                    next_x, next_y = x + dx, y + dy
+                    if 0 <= next_x < width and 0 <= next_y < height and not blocked[next_x * height + next_y]:
+                        cellActions.append(dir)
+                        cellNeighbors.append((next_x, next_y))
+                actions.append(tuple(cellActions))
+                neighbors.append(tuple(cellNeighbors))
+        return actions, neighbors
+    _buildMoveTables = staticmethod(_buildMoveTables)
+
     def getSuccessor(position, action):
         dx, dy = Actions.directionToVector(action)
         x, y = position
@@ -370,20 +503,29 @@ class Actions:
 
 class GameStateData:
     """
+    The food, capsules, layout and agent states of a game.
 
+    A new data packet shares all of these with its predecessor (copy-on-write).
+    The food grid, capsule list and _eaten list are never changed in place but
+    replaced by changed copies, and an agent state has to be fetched with
+    getWritableAgentState before it is modified. deepCopy returns a packet
+    that shares none of them.
     """
     def __init__( self, prevState = None ):
         """
-        Generates a new data packet by copying information from its predecessor.
+        Generates a new data packet sharing the information of its predecessor.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            # The agent states are now shared, so neither side may write them in place
+            prevState._ownAgentStates = None
 
+        self._ownAgentStates = None
         self._foodEaten = None
         self._foodAdded = None
         self._capsuleEaten = None
@@ -393,15 +535,39 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
+        """
+        Returns a copy that shares nothing but the layout (which never
+        changes) with this data packet, so it may be changed in place.
+        Agents that only read the state can avoid this copy by setting
+        Agent.readOnlyState.
+        """
+        ownAgentStates = self._ownAgentStates
         state = GameStateData( self )
+        self._ownAgentStates = ownAgentStates
         state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state.capsules = self.capsules[:]
+        state._eaten = self._eaten[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._ownAgentStates = [True for agentState in state.agentStates]
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def getWritableAgentState( self, index ):
+        """
+        Returns agentStates[index] for changing it in place, copying it first
+        if it may still be shared with another data packet.
+        """
+        if self._ownAgentStates is None:
+            self.agentStates = self.agentStates[:]
+            self._ownAgentStates = [False for agentState in self.agentStates]
+        if not self._ownAgentStates[index]:
+            self.agentStates[index] = self.agentStates[index].copy()
+            self._ownAgentStates[index] = True
+        return self.agentStates[index]
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -434,7 +600,7 @@ class GameStateData:
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
+        map = [[None for y in range(height)] for x in range(width)]
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
         for x in range(width):
@@ -455,7 +621,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        rows.reverse()
+        return '\n'.join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -510,6 +678,21 @@ try:
 except:
     _BOINC_ENABLED = False
 
+class _OutputSwitch:
+    """
+    Takes the place of sys.stdout or sys.stderr while a Game mutes its agents,
+    and writes to whichever stream is currently selected.
+    """
+    def __init__( self, original ):
+        self.original = original
+        self.stream = original
+
+    def write( self, string ):
+        self.stream.write(string)
+
+    def __getattr__( self, name ):
+        return getattr(self.stream, name)
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
@@ -544,31 +727,45 @@ class Game:
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
-    OLD_STDOUT = None
-    OLD_STDERR = None
-
     def mute(self, agentIndex):
         if not self.muteAgents: return
-        global OLD_STDOUT, OLD_STDERR
-        import cStringIO
-        OLD_STDOUT = sys.stdout
-        OLD_STDERR = sys.stderr
-        sys.stdout = self.agentOutput[agentIndex]
-        sys.stderr = self.agentOutput[agentIndex]
+        self._stdout.stream = self._stderr.stream = self.agentOutput[agentIndex]
 
     def unmute(self):
         if not self.muteAgents: return
-        global OLD_STDOUT, OLD_STDERR
         # Revert stdout/stderr to originals
-        sys.stdout = OLD_STDOUT
-        sys.stderr = OLD_STDERR
-
+        self._stdout.stream = self._stdout.original
+        self._stderr.stream = self._stderr.original
 
     def run( self ):
         """
         Main control loop for game play.
+
+        sys.stdout and sys.stderr are replaced once for the whole game when
+        agents are muted, and with catchExceptions all time limits share the
+        SIGALRM handler of one util.DeadlineTimer.
         """
+        if self.muteAgents:
+            self._stdout, self._stderr = _OutputSwitch(sys.stdout), _OutputSwitch(sys.stderr)
+            sys.stdout, sys.stderr = self._stdout, self._stderr
+        self.timer = DeadlineTimer()
+        if self.catchExceptions: self.timer.start()
+        try:
+            self._play()
+        finally:
+            if self.catchExceptions: self.timer.stop()
+            if self.muteAgents:
+                sys.stdout, sys.stderr = self._stdout.original, self._stderr.original
+
+    def _stateFor( self, agentIndex, readOnly ):
+        "The state to show an agent: the game's own if it only reads it, else a copy."
+        if readOnly[agentIndex]: return self.state
+        return self.state.deepCopy()
+
+    def _play( self ):
         self.display.initialize(self.state.data)
+        readOnly = [getattr(agent, 'readOnlyState', False) for agent in self.agents]
+        observes = [hasattr(agent, 'observationFunction') for agent in self.agents]
         self.numMoves = 0
 
         ###self.display.initialize(self.state.makeObservation(1).data)
@@ -587,10 +784,9 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
                         try:
                             start_time = time.time()
-                            timed_func(self.state.deepCopy())
+                            self.timer.call(int(self.rules.getMaxStartupTime(i)), agent.registerInitialState, self._stateFor(i, readOnly))
                             time_taken = time.time() - start_time
                             self.totalAgentTimes[i] += time_taken
                         except TimeoutFunctionException:
@@ -604,7 +800,7 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    agent.registerInitialState(self.state.deepCopy())
+                    agent.registerInitialState(self._stateFor(i, readOnly))
                 ## TODO: could this exceed the total time
                 self.unmute()
 
@@ -617,14 +813,13 @@ class Game:
             move_time = 0
             skip_action = False
             # Generate an observation of the state
-            if 'observationFunction' in dir( agent ):
+            if observes[agentIndex]:
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
                         try:
                             start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = self.timer.call(int(self.rules.getMoveTimeout(agentIndex)), agent.observationFunction, self._stateFor(agentIndex, readOnly))
                         except TimeoutFunctionException:
                             skip_action = True
                         move_time += time.time() - start_time
@@ -634,22 +829,21 @@ class Game:
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(self._stateFor(agentIndex, readOnly))
                 self.unmute()
             else:
-                observation = self.state.deepCopy()
+                observation = self._stateFor(agentIndex, readOnly)
 
             # Solicit an action
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
                     try:
                         start_time = time.time()
                         if skip_action:
                             raise TimeoutFunctionException()
-                        action = timed_func( observation )
+                        action = self.timer.call(self.rules.getMoveTimeout(agentIndex) - move_time, agent.getAction, observation)
                     except TimeoutFunctionException:
                         print >>sys.stderr, "Agent %d timed out on a single move!" % agentIndex
                         self.agentTimeout = True
@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -71,14 +72,37 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
+    # static variables keep track of the states generateSuccessor was called on
+    # or produced; how is chosen with setExploredTracking
     explored = set()
+    exploredCount = 0
+    exploredTracking = 'count'
+    exploredLimit = 0
     def getAndResetExplored():
         tmp = GameState.explored.copy()
         GameState.explored = set()
+        GameState.exploredCount = 0
         return tmp
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def setExploredTracking( tracking='count', limit=0 ):
+        """
+        Chooses what generateSuccessor records, and resets what was recorded:
+          'set'   - the states themselves in GameState.explored, at most limit
+                    of them if limit is positive
+          'count' - only the number of successors in GameState.exploredCount
+          'off'   - nothing
+        In 'set' mode exploredCount keeps counting after the limit is reached.
+        The default is 'count': nothing in the game reads the states, and an
+        unbounded set keeps every state of a long run in memory.
+        """
+        if tracking not in EXPLORED_TRACKING_MODES:
+            raise Exception('Unknown explored tracking mode: ' + str(tracking))
+        GameState.exploredTracking = tracking
+        GameState.exploredLimit = limit
+        GameState.getAndResetExplored()
+    setExploredTracking = staticmethod(setExploredTracking)
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
@@ -98,6 +122,23 @@ class GameState:
         # Check that successors exist
         if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
 
+        state = self._applyMove( agentIndex, action )
+
+        tracking = GameState.exploredTracking
+        if tracking != 'off':
+            GameState.exploredCount += 1
+            if tracking == 'set':
+                explored, limit = GameState.explored, GameState.exploredLimit
+                if limit <= 0 or len(explored) + 2 <= limit:
+                    explored.add(self)
+                    explored.add(state)
+        return state
+
+    def _applyMove( self, agentIndex, action ):
+        """
+        Returns the successor after the move, without the terminal state check
+        and explored tracking of generateSuccessor.
+        """
         # Copy current state
         state = GameState(self)
 
@@ -112,7 +153,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.getWritableAgentState( agentIndex ) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -120,8 +161,6 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -146,9 +185,17 @@ class GameState:
         return self.data.agentStates[0].getPosition()
 
     def getGhostStates( self ):
+        """
+        Returns the AgentStates of the ghosts. They are shared with the states
+        this one was generated from or to, so they must not be changed.
+        """
         return self.data.agentStates[1:]
 
     def getGhostState( self, agentIndex ):
+        """
+        Returns the AgentState of a ghost; like getGhostStates, it must not
+        be changed.
+        """
         if agentIndex == 0 or agentIndex >= self.getNumAgents():
             raise Exception("Invalid index passed to getGhostState")
         return self.data.agentStates[agentIndex]
@@ -262,6 +309,7 @@ class GameState:
 SCARED_TIME = 40    # Moves ghosts are scared
 COLLISION_TOLERANCE = 0.7 # How close ghosts must be to Pacman to kill
 TIME_PENALTY = 1 # Number of points lost each round
+EXPLORED_TRACKING_MODES = ['set', 'count', 'off'] # See GameState.setExploredTracking
 
 class ClassicGameRules:
     """
@@ -342,7 +390,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.getWritableAgentState( 0 )
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -407,7 +455,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.getWritableAgentState( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -417,7 +465,7 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            ghostState.configuration = Configuration( nearestPoint( ghostState.configuration.pos ), ghostState.configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -439,9 +487,11 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.getWritableAgentState( agentIndex )
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -457,6 +507,39 @@ class GhostRules:
         ghostState.configuration = ghostState.start
     placeGhost = staticmethod( placeGhost )
 
+############
+# ROLLOUTS #
+############
+
+def rollout( state, policies, depth, startingIndex=0 ):
+    """
+    Plays depth plies (single agent moves) from state, starting with agent
+    startingIndex, and returns the score and whether the game is over.
+
+    policies[i] is called with the current state and returns the move of
+    agent i; an agent's getAction method or randomPolicy(i) will do. There is
+    no display, recording, time limit or explored tracking, so this is meant
+    for Monte Carlo simulations. The rollout stops early when the game ends.
+    """
+    numAgents = len( state.data.agentStates )
+    if len( policies ) != numAgents:
+        raise Exception('Need a policy for each of the %d agents, got %d' % (numAgents, len(policies)))
+    agentIndex = startingIndex
+    data = state.data
+    for ply in xrange( depth ):
+        if data._win or data._lose: break
+        state = state._applyMove( agentIndex, policies[agentIndex]( state ) )
+        data = state.data
+        agentIndex += 1
+        if agentIndex == numAgents: agentIndex = 0
+    return data.score, data._win or data._lose
+
+def randomPolicy( agentIndex ):
+    "A rollout policy that picks one of agentIndex's legal moves uniformly at random."
+    if agentIndex == 0:
+        return lambda state: random.choice( PacmanRules.getLegalActions( state ) )
+    return lambda state: random.choice( GhostRules.getLegalActions( state, agentIndex ) )
+
 #############################
 # FRAMEWORK TO START A GAME #
 #############################
@@ -515,7 +598,9 @@ def readCommand( argv ):
     parser.add_option('-r', '--recordActions', action='store_true', dest='record',
                       help='Writes game histories to a file (named by the time they were played)', default=False)
     parser.add_option('--replay', dest='gameToReplay',
-                      help='A recorded game file (pickle) to replay', default=None)
+                      help='A recorded game file to replay', default=None)
+    parser.add_option('--replayFrom', dest='replayFrom', type='int',
+                      help=default('The move at which to start replaying a recorded game'), default=0)
     parser.add_option('-a','--agentArgs',dest='agentArgs',
                       help='Comma separated values sent to agent. e.g. "opt1=val1,opt2,opt3=val3"')
     parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
@@ -526,6 +611,14 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help=default('Number of processes playing the non-training games in parallel (needs -q or -t)'), default=1)
+    parser.add_option('--exploredTracking', dest='exploredTracking', type='choice', choices=EXPLORED_TRACKING_MODES,
+                      help=default('What GameState.explored records: set, count or off'), default='count')
+    parser.add_option('--exploredLimit', dest='exploredLimit', type='int',
+                      help=default('Maximum number of states kept in GameState.explored, 0 for no limit'), default=0)
+    parser.add_option('--layoutCache', dest='layoutCache', metavar='DIR',
+                      help='Keep parsed layouts and visibility matrices in DIR between runs', default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -535,7 +628,11 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    # Bound the memory spent on tracking explored states
+    GameState.setExploredTracking( options.exploredTracking, options.exploredLimit )
+
     # Choose a layout
+    if options.layoutCache != None: layout.LAYOUT_CACHE_DIR = options.layoutCache
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
 
@@ -573,10 +670,18 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['workers'] = options.workers
+    if options.workers > 1 and not (options.quietGraphics or options.textGraphics):
+        raise Exception('Games can only be played by several workers with -q or -t')
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
         print 'Replaying recorded game %s.' % options.gameToReplay
+        import recording
+        if recording.isRecording( options.gameToReplay ):
+            replayRecording( options.gameToReplay, args['display'], options.replayFrom )
+            sys.exit(0)
+        # Games recorded before recording.py were pickled
         import cPickle
         f = open(options.gameToReplay)
         try: recorded = cPickle.load(f)
@@ -628,14 +733,48 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def replayRecording( fileName, display, startMove=0 ):
+    """
+    Replays a game written by recordGame, starting with the state after
+    startMove moves (see recording.RecordedGame).
+    """
+    import pacmanAgents, ghostAgents, recording
+    recorded = recording.RecordedGame( fileName )
+    try:
+        rules = ClassicGameRules()
+        agents = [pacmanAgents.GreedyAgent()] + [ghostAgents.RandomGhost(i+1) for i in range(recorded.numAgents - 1)]
+        game = rules.newGame( recorded.layout, agents[0], agents[1:], display )
+        states = recorded.states( startMove )
+        display.initialize( states.next().data )
+
+        for state in states:
+            # Change the display
+            display.update( state.data )
+            # Allow for game specific conditions (winning, losing, etc.)
+            rules.process(state, game)
+    finally:
+        recorded.close()
+
+    display.finish()
+
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, workers=1 ):
+    """
+    Plays numGames games, the first numTraining of them quietly, and reports
+    the scores of the others.
+
+    With more than one worker, the training games are still played here one
+    after another, and the remaining games are then shared out to a pool of
+    worker processes (see runGamesInParallel).
+    """
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
 
-    for i in range( numGames ):
+    sequentialGames = numGames
+    if workers > 1: sequentialGames = min(numTraining, numGames)
+    for i in range( sequentialGames ):
         beQuiet = i < numTraining
         if beQuiet:
                 # Suppress output and graphics
@@ -649,13 +788,14 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         game.run()
         if not beQuiet: games.append(game)
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+        if record: recordGame( layout, game.state.getNumAgents(), game.moveHistory, i )
+
+    if sequentialGames < numGames:
+        indices = range( sequentialGames, numGames )
+        finished = runGamesInParallel( rules, layout, pacman, ghosts, display, indices, catchExceptions, workers )
+        for i, game in zip( indices, finished ):
+            games.append(game)
+            if record: recordGame( layout, game.state.getNumAgents(), game.moveHistory, i )
 
     if (numGames-numTraining) > 0:
         scores = [game.state.getScore() for game in games]
@@ -668,6 +808,79 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
 
     return games
 
+def recordGame( layout, numAgents, moveHistory, index ):
+    """
+    Writes the history of game number index to a file named by the time it was
+    played, in the compact format of recording.py
+    """
+    import time, recording
+    fname = ('recorded-game-%d' % (index + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    recording.writeRecording( fname, layout, numAgents, moveHistory )
+
+class FinishedGame:
+    """
+    What is sent back from a worker process for a game it played: the parts
+    of the Game object that runGames and its callers use.
+    """
+    def __init__( self, game, output ):
+        self.state = game.state
+        self.moveHistory = game.moveHistory
+        self.agentCrashed = game.agentCrashed
+        self.agentTimeout = game.agentTimeout
+        self.output = output
+
+# The game setup shared with pool workers, which inherit it when they are forked
+_parallelGameSetup = None
+
+def playParallelGame( task ):
+    """
+    Plays one game in a pool worker. task is a (game number, random seed)
+    pair; the game's output is captured and returned in a FinishedGame.
+    """
+    import cStringIO
+    index, seed = task
+    rules, layout, pacman, ghosts, display, catchExceptions = _parallelGameSetup
+    random.seed( seed )
+    stdout = sys.stdout
+    sys.stdout = cStringIO.StringIO()
+    try:
+        game = rules.newGame( layout, pacman, ghosts, display, False, catchExceptions )
+        game.run()
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+    return FinishedGame( game, output )
+
+def runGamesInParallel( rules, layout, pacman, ghosts, display, indices, catchExceptions, workers ):
+    """
+    Plays the games numbered by indices in a pool of worker processes and
+    returns them as FinishedGames, in order.
+
+    Game i is seeded with a base seed drawn from this process plus i, and
+    every game is played by a freshly forked worker, i.e. by the agents as
+    they were before the first parallel game. The outcome therefore does
+    not depend on the number of workers. The output of each game is printed
+    here, in game order.
+    """
+    import multiprocessing
+    global _parallelGameSetup
+    _parallelGameSetup = (rules, layout, pacman, ghosts, display, catchExceptions)
+    baseSeed = random.randint( 0, sys.maxint - len(indices) )
+    pool = multiprocessing.Pool( workers, maxtasksperchild=1 )
+    try:
+        games = []
+        for game in pool.imap( playParallelGame, [(i, baseSeed + i) for i in indices] ):
+            sys.stdout.write( game.output )
+            games.append( game )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _parallelGameSetup = None
+    return games
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
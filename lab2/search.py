@@ -89,6 +89,61 @@ def constrainedBreadthFirstSearch(problem, legalStates):
     print "Search finished, final state not found!"
     return
 
+def constrainedBidirectionalSearch(problem, legalStates):
+    """
+    A bidirectional breadth-first search that finds a shortest path from
+    the start state to problem.goal going only through given states.
+    Moves must be reversible with unit cost, as they are in a maze.
+    Like constrainedBreadthFirstSearch, it returns None when the goal is
+    not one of the given states.
+    """
+    start, goal = problem.getStartState(), problem.goal
+    if start == goal:
+        return []
+    if goal not in legalStates:
+        print "Search finished, final state not found!"
+        return
+
+    # the best known node for every state reached from either end
+    reached = ({start: SearchNode(start)}, {goal: SearchNode(goal)})
+    frontiers = ([start], [goal])
+
+    # grow the smaller frontier by one whole layer until the trees touch
+    while frontiers[0] and frontiers[1]:
+        side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+        nodes, otherNodes = reached[side], reached[1 - side]
+
+        meeting = None
+        nextFrontier = []
+        for state in frontiers[side]:
+            node = nodes[state]
+            for futureState, move, _ in problem.getSuccessors(state):
+                if futureState in nodes or futureState not in legalStates:
+                    continue
+                nodes[futureState] = SearchNode(futureState, parent=node, transition=move, cost=node.cost + 1)
+                nextFrontier.append(futureState)
+                if futureState in otherNodes:
+                    total = nodes[futureState].cost + otherNodes[futureState].cost
+                    if meeting is None or total < meeting[0]:
+                        meeting = (total, futureState)
+        frontiers = (nextFrontier, frontiers[1]) if side == 0 else (frontiers[0], nextFrontier)
+
+        if meeting is not None:
+            # walk both trees outwards from the meeting state
+            forwardNode, backwardNode = reached[0][meeting[1]], reached[1][meeting[1]]
+            moves = []
+            while forwardNode.parent is not None:
+                moves.append(forwardNode.transition)
+                forwardNode = forwardNode.parent
+            moves.reverse()
+            while backwardNode.parent is not None:
+                moves.append(Actions.reverseDirection(backwardNode.transition))
+                backwardNode = backwardNode.parent
+            return moves
+
+    print "Search finished, final state not found!"
+    return
+
 
 
 class PositionSearchProblem():
@@ -185,7 +240,7 @@ class PositionSearchProblem():
 def pathBetween(point1, point2, legalStates, gameState):
     """
     Returns a possible shortest path through visited states 
-    between any two points, using constrained BFS 
+    between any two points, using constrained bidirectional BFS 
     The gameState can be any game state -- Pacman's
     position in that state is ignored.
 
@@ -198,4 +253,4 @@ def pathBetween(point1, point2, legalStates, gameState):
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
     prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return constrainedBreadthFirstSearch(prob, legalStates)
+    return constrainedBidirectionalSearch(prob, legalStates)
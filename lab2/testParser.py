@@ -12,8 +12,19 @@
 # Pieter Abbeel (pabbeel@cs.berkeley.edu).
 
 
+import hashlib
+import os
 import re
 import sys
+import util
+
+# Parsed files by path: (modification time, size, content hash, dictionary)
+PARSE_CACHE = {}
+
+# Where parsed files are also kept between runs, by content hash; None keeps
+# them in this process only
+PARSE_CACHE_DIR = None
+_CACHE_VERSION = 1
 
 class TestParser(object):
 
@@ -33,14 +44,37 @@ class TestParser(object):
         return '\n'.join(fixed_lines)
 
     def parse(self):
-        # read in the test case and remove comments
-        test = {}
-        with open(self.path) as handle:
-            raw_lines = handle.read().split('\n')
+        """
+        Returns the file as a dictionary. A file is only parsed again when it
+        has changed: its modification time and size are checked first, then
+        the hash of its contents. Every call returns a new copy.
+        """
+        stat = os.stat(self.path)
+        cached = PARSE_CACHE.get(self.path)
+        if cached == None or cached[:2] != (stat.st_mtime, stat.st_size):
+            with open(self.path) as handle:
+                contents = handle.read()
+            digest = hashlib.sha1(contents).hexdigest()
+            if cached != None and cached[2] == digest:
+                test = cached[3]
+            else:
+                test = _loadParsed(digest)
+                if test == None:
+                    test = self.parseLines(contents.split('\n'))
+                    _saveParsed(digest, test)
+            cached = PARSE_CACHE[self.path] = (stat.st_mtime, stat.st_size, digest, test)
+        # the file may define a 'path' property of its own, which wins
+        test = {'path': self.path}
+        test.update(cached[3])
+        test['__raw_lines__'] = test['__raw_lines__'][:]
+        test['__emit__'] = test['__emit__'][:]
+        return test
 
+    def parseLines(self, raw_lines):
+        # remove comments from the test case
+        test = {}
         test_text = self.removeComments(raw_lines)
         test['__raw_lines__'] = raw_lines
-        test['path'] = self.path
         test['__emit__'] = []
         lines = test_text.split('\n')
         i = 0
@@ -73,6 +107,20 @@ class TestParser(object):
         return test
 
 
+def _cacheFile(digest):
+    return os.path.join(PARSE_CACHE_DIR, digest + '.pkl')
+
+def _loadParsed(digest):
+    "Returns the dictionary stored by _saveParsed, or None."
+    if PARSE_CACHE_DIR == None: return None
+    return util.loadCacheFile(_cacheFile(digest), _CACHE_VERSION)
+
+def _saveParsed(digest, test):
+    "Stores a parsed file in PARSE_CACHE_DIR, unless it is already there."
+    if PARSE_CACHE_DIR == None or os.path.exists(_cacheFile(digest)): return
+    util.saveCacheFile(_cacheFile(digest), _CACHE_VERSION, test)
+
+
 def emitTestDict(testDict, handle):
     for kind, data in testDict['__emit__']:
         if kind == "raw":
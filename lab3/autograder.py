@@ -13,20 +13,27 @@
 
 
 # imports from python standard library
+import cPickle
 import grading
+import hashlib
 import imp
 import optparse
 import os
 import re
 import sys
+import traceback
 import projectParams
 import random
+import util
 random.seed(0)
 try: 
     from pacman import GameState
 except:
     pass
 
+# where --incremental keeps its results unless --cache-dir is given
+DEFAULT_CACHE_DIR = '.autograder_cache'
+
 # register arguments and set default values
 def readCommand(argv):
     parser = optparse.OptionParser(description = 'Run public tests on student code')
@@ -75,6 +82,21 @@ def readCommand(argv):
                     dest = 'noGraphics',
                     action = 'store_true',
                     help = 'No graphics display for pacman games.')
+    parser.add_option('--workers', '-j',
+                    dest = 'workers',
+                    type = 'int',
+                    default = 1,
+                    help = 'Run test cases in this many worker processes (implies --no-graphics). Every test case, in sequential runs too, starts from random.seed(\'<question>/<test>\').')
+    parser.add_option('--cache-dir',
+                    dest = 'cacheDir',
+                    default = None,
+                    help = 'Keep parsed test, solution and layout files (and test results for --incremental) in this directory between runs.')
+    parser.add_option('--incremental', '-i',
+                    dest = 'incremental',
+                    action = 'store_true',
+                    default = False,
+                    help = 'Only run test cases whose files or student code changed since the last run, '
+                           'and replay the others (the cache directory defaults to %s).' % DEFAULT_CACHE_DIR)
     (options, args) = parser.parse_args(argv)
     return options
 
@@ -239,9 +261,339 @@ def getTestSubdirs(testParser, testRoot, questionToGrade):
     return sorted(os.listdir(testRoot))
 
 
+#######################################################################
+# Parallel grading
+#######################################################################
+
+# Test case functions by (question, test number), read by the forked workers
+_PARALLEL_TESTS = {}
+
+# The Grades methods a test case may call; workers record them for replay
+RECORDED_GRADES_METHODS = ['addMessage', 'addMessageToEmail', 'addPoints', 'deductPoints',
+                           'assignFullCredit', 'assignZeroCredit', 'fail']
+
+class WorkerOutput:
+    "Stands in for sys.stdout in a worker and records what is written as events."
+    def __init__(self, events):
+        self.events = events
+        self.paused = False
+
+    def write(self, string):
+        if self.paused or not string: return
+        if self.events and self.events[-1][0] == 'write':
+            self.events[-1] = ('write', self.events[-1][1] + string)
+        else:
+            self.events.append(('write', string))
+
+    def flush(self):
+        pass
+
+class RecordingGrades:
+    """
+    The grades object a test case sees in a worker. Calls that change the
+    grades are recorded as events (and applied to a local Grades without
+    printing anything), everything else is read from the local Grades.
+    """
+    def __init__(self, grades, output):
+        self.grades = grades
+        self.output = output
+
+    def __getattr__(self, name):
+        method = getattr(self.grades, name)
+        if name not in RECORDED_GRADES_METHODS: return method
+        def record(*args, **keyArgs):
+            self.output.events.append(('call', name, args, keyArgs))
+            self.output.paused = True
+            try: return method(*args, **keyArgs)
+            finally: self.output.paused = False
+        return record
+
+def recordTestCase(testFunction, q, maxPoints, muteOutput):
+    """
+    Runs a test case function on its own grades and returns its events: what
+    it printed and the grades calls it made, in order, followed by how it
+    ended ('return', value), ('raise', exception, frames) or ('abort',).
+    """
+    events = []
+    output = WorkerOutput(events)
+    stdout = sys.stdout
+    util.unmutePrint()
+    unmuted = sys.stdout
+    sys.stdout = output
+    output.paused = True
+    grades = grading.Grades(projectParams.PROJECT_NAME, [(q, maxPoints)], muteOutput=muteOutput)
+    output.paused = False
+    grades.currentQuestion = q
+    if muteOutput: util.mutePrint()
+    try:
+        events.append(('return', testFunction(RecordingGrades(grades, output))))
+    except Exception, inst:
+        # The first frame is this function's; the rest are the test case's
+        frames = traceback.extract_tb(sys.exc_info()[2])[1:]
+        try:
+            inst = cPickle.loads(cPickle.dumps(inst, 2))
+        except Exception:
+            inst = Exception(str(inst))
+        events.append(('raise', inst, frames))
+    except:
+        events.append(('abort',))
+    finally:
+        if muteOutput: util.unmutePrint()
+        sys.stdout = unmuted
+        if stdout is not unmuted: util.mutePrint()
+    return events
+
+def runTestCase(task):
+    "Runs one test case in a worker process and returns its events."
+    return _PARALLEL_TESTS[task]()
+
+class RemoteAbort(BaseException):
+    "Re-raised for a test case that was ended by something other than an Exception."
+
+def makeReplay(getEvents):
+    """
+    Returns a test case function that replays the events getEvents(grades)
+    returns: the output and grades calls happen in the recorded order, and an
+    exception is raised again with the frames of the test case. It raises the
+    exception itself, so that it takes the place of the test case function's
+    frame in tracebacks.
+    """
+    def replayTestCase(grades):
+        events = getEvents(grades)
+        for event in events[:-1]:
+            if event[0] == 'write':
+                sys.stdout.write(event[1])
+            else:
+                _, name, args, keyArgs = event
+                getattr(grades, name)(*args, **keyArgs)
+        outcome = events[-1]
+        if outcome[0] == 'return': return outcome[1]
+        if outcome[0] == 'abort': raise RemoteAbort()
+        _, inst, frames = outcome
+        inst.remoteFrames = frames
+        raise inst
+    return replayTestCase
+
+class TestScheduler:
+    """
+    Runs test cases in a pool of worker processes while Grades.grade goes
+    through the questions in order, as usual. Each test case function is
+    replaced by one that waits for the worker's events and replays them, so
+    the output is that of a sequential run.
+
+    The test cases of a question are started once all of its prerequisites
+    have been graded and completed. The workers are forked from this process
+    after the questions are loaded and run many test cases each.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.tests = {}
+        self.results = {}
+        self.pool = None
+
+    def add(self, q, record):
+        """
+        Registers the next test case of q, run by record() (which returns its
+        events, see recordTestCase), and returns the function that replays it.
+        """
+        index = len(self.tests.setdefault(q, []))
+        self.tests[q].append(index)
+        _PARALLEL_TESTS[q, index] = record
+        return makeReplay(lambda grades: self.getEvents(q, index, grades))
+
+    def start(self, grades):
+        import multiprocessing
+        self.pool = multiprocessing.Pool(self.workers)
+        for q in grades.questions:
+            if len(grades.prereqs[q]) == 0: self.submit(q)
+
+    def stop(self):
+        if self.pool != None:
+            self.pool.terminate()
+            self.pool.join()
+        _PARALLEL_TESTS.clear()
+
+    def submit(self, q):
+        if q in self.results: return
+        self.results[q] = [self.pool.apply_async(runTestCase, [(q, index)])
+                           for index in self.tests.get(q, [])]
+
+    def submitReady(self, grades):
+        "Starts the questions whose prerequisites have all been graded with full points."
+        graded = grades.questions[:grades.questions.index(grades.currentQuestion)]
+        for q in grades.questions:
+            prereqs = grades.prereqs[q]
+            if all([p in graded and grades.points[p] >= grades.maxes[p] for p in prereqs]):
+                self.submit(q)
+
+    def getEvents(self, q, index, grades):
+        self.submitReady(grades)
+        self.submit(q)
+        result = self.results[q][index]
+        # Waiting with a timeout lets the question's time limit interrupt us
+        while not result.ready(): result.wait(1)
+        return result.get()
+
+
+#######################################################################
+# Incremental grading
+#######################################################################
+
+_RESULT_VERSION = 2
+
+class ModuleView:
+    "Stands in for a student module in test cases and notes when it is used."
+    def __init__(self, module, used):
+        self.__dict__['_module'] = module
+        self.__dict__['_used'] = used
+
+    def __getattr__(self, name):
+        self._used.add(self._module.__name__)
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        self._used.add(self._module.__name__)
+        setattr(self._module, name, value)
+
+class ModuleUse(dict):
+    """
+    The module dictionary given to test cases: the student modules in it are
+    replaced by ModuleViews, which note the modules a test case really uses
+    (tests often look up modules they do not need).
+    """
+    def __init__(self, moduleDict, studentModules):
+        dict.__init__(self, moduleDict)
+        self.used = set()
+        for name in studentModules:
+            if name in self: self[name] = ModuleView(moduleDict[name], self.used)
+
+class ResultCache:
+    """
+    Keeps the events of test cases (see recordTestCase) in a directory, so
+    that a test case whose inputs did not change is replayed instead of run.
+
+    A result is stored under a key that hashes the test's .test and .solution
+    files, the output options, every Python file in the code directory other
+    than the student's and every layout in its layouts directory. With it go the hashes of the student modules
+    the test case used: the ones it used through the module dictionary and
+    the student modules those import (all of them if it used none). The
+    result is replayed as long as those modules are unchanged.
+
+    Timeouts and aborted test cases are not stored.
+    """
+    def __init__(self, directory, codeRoot, studentFiles):
+        "studentFiles maps the student module names to their files."
+        self.directory = directory
+        self.sources = {}
+        for name, path in studentFiles.items():
+            self.sources[name] = _fileHash(path)
+        student = set([os.path.abspath(path) for path in studentFiles.values()])
+        codeDir = codeRoot or os.curdir
+        framework = sorted([f for f in os.listdir(codeDir) if f.endswith('.py')
+                            and os.path.abspath(os.path.join(codeDir, f)) not in student])
+        self.fingerprint = hashlib.sha1()
+        for f in framework:
+            self.fingerprint.update('%s %s\n' % (f, _fileHash(os.path.join(codeDir, f))))
+        layoutDir = os.path.join(codeDir, 'layouts')
+        if os.path.isdir(layoutDir):
+            for f in sorted([f for f in os.listdir(layoutDir) if f.endswith('.lay')]):
+                self.fingerprint.update('layouts/%s %s\n' % (f, _fileHash(os.path.join(layoutDir, f))))
+        self.modules = {}
+        self.used = set()
+
+    def track(self, moduleDict):
+        "Returns the module dictionary to give the test cases."
+        self.modules = moduleDict
+        tracked = ModuleUse(moduleDict, self.sources)
+        self.used = tracked.used
+        return tracked
+
+    def testKey(self, testFile, solutionFile, muteOutput, printTestCase):
+        key = self.fingerprint.copy()
+        key.update('%s %s %s %s\n' % (testFile, _fileHash(testFile), muteOutput, printTestCase))
+        if os.path.exists(solutionFile): key.update(_fileHash(solutionFile))
+        return key.hexdigest()
+
+    def add(self, q, maxPoints, testFunction, key, muteOutput, scheduler=None):
+        """
+        Returns the function that replays the stored result of a test case,
+        or that runs it (in the scheduler, if there is one) and stores it.
+        """
+        events = self.load(key)
+        if events != None:
+            return makeReplay(lambda grades: events)
+        def record():
+            self.used.clear()
+            events = recordTestCase(testFunction, q, maxPoints, muteOutput)
+            self.save(key, events)
+            return events
+        if scheduler != None:
+            return scheduler.add(q, record)
+        return makeReplay(lambda grades: record())
+
+    def dependencies(self, used):
+        "Returns the student modules in used and those they import, recursively."
+        names = [name for name in used if name in self.sources]
+        if len(names) == 0: names = self.sources.keys()
+        dependencies = set()
+        while len(names) > 0:
+            name = names.pop()
+            if name in dependencies: continue
+            dependencies.add(name)
+            if name not in self.modules: continue
+            for value in vars(self.modules[name]).values():
+                module = getattr(value, '__name__', None) if type(value) == type(sys) else getattr(value, '__module__', None)
+                if module in self.sources: names.append(module)
+        return dependencies
+
+    def resultFile(self, key):
+        return os.path.join(self.directory, key + '.result')
+
+    def load(self, key):
+        "Returns the stored events for key if the student modules they used are unchanged, or None."
+        result = util.loadCacheFile(self.resultFile(key), _RESULT_VERSION)
+        if result == None: return None
+        sources, events = result
+        for name in sources:
+            if self.sources.get(name) != sources[name]: return None
+        return events
+
+    def save(self, key, events):
+        outcome = events[-1]
+        if outcome[0] == 'abort' or (outcome[0] == 'raise' and isinstance(outcome[1], util.TimeoutFunctionException)):
+            return
+        sources = dict([(name, self.sources[name]) for name in self.dependencies(self.used)])
+        util.saveCacheFile(self.resultFile(key), _RESULT_VERSION, (sources, events))
+
+def _fileHash(path):
+    with open(path, 'rb') as handle:
+        return hashlib.sha1(handle.read()).hexdigest()
+
+def seedTestCase(testFunction, seed):
+    """
+    Returns a test case function that reseeds random with seed before running
+    testFunction, so that a test case sees the same random numbers whether it
+    runs sequentially, in a --workers process or after other test cases.
+
+    This changed the random numbers of sequential runs as well: they used to
+    seed random once, with random.seed(0) at import, and every test case
+    went on with the stream the ones before it left.
+    """
+    def seededTestCase(grades):
+        random.seed(seed)
+        return testFunction(grades)
+    return seededTestCase
+
+
 # evaluate student code
 def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MAP, edxOutput=False, muteOutput=False,
-            printTestCase=False, questionToGrade=None, display=None):
+            printTestCase=False, questionToGrade=None, display=None, workers=1, resultCache=None):
+    """
+    Grades the questions in testRoot. With more than one worker (and fork,
+    which the workers rely on) the test cases run in a TestScheduler; the
+    output is the same as that of a sequential run. With a ResultCache only
+    the test cases whose inputs changed are run.
+    """
     # imports of testbench code.  note that the testClasses import must follow
     # the import of student code due to dependencies
     import testParser
@@ -249,6 +601,14 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
     for module in moduleDict:
         setattr(sys.modules[__name__], module, moduleDict[module])
 
+    scheduler = None
+    if workers > 1 and not generateSolutions and hasattr(os, 'fork'):
+        scheduler = TestScheduler(workers)
+    if generateSolutions:
+        resultCache = None
+    if resultCache != None:
+        moduleDict = resultCache.track(moduleDict)
+
     questions = []
     questionDicts = {}
     test_subdirs = getTestSubdirs(testParser, testRoot, questionToGrade)
@@ -276,19 +636,26 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
             testDict['test_out_file'] = test_out_file
             testClass = getattr(projectTestClasses, testDict['class'])
             testCase = testClass(question, testDict)
-            def makefun(testCase, solution_file):
+            def makefun(testCase, testDict, solution_file):
                 if generateSolutions:
                     # write solution file to disk
                     return lambda grades: testCase.writeSolution(moduleDict, solution_file)
                 else:
                     # read in solution dictionary and pass as an argument
-                    testDict = testParser.TestParser(test_file).parse()
                     solutionDict = testParser.TestParser(solution_file).parse()
                     if printTestCase:
                         return lambda grades: printTest(testDict, solutionDict) or testCase.execute(grades, moduleDict, solutionDict)
                     else:
                         return lambda grades: testCase.execute(grades, moduleDict, solutionDict)
-            question.addTestCase(testCase, makefun(testCase, solution_file))
+            testFunction = seedTestCase(makefun(testCase, testDict, solution_file), '%s/%s' % (q, t))
+            if resultCache != None:
+                key = resultCache.testKey(test_file, solution_file, muteOutput, printTestCase)
+                testFunction = resultCache.add(q, question.getMaxPoints(), testFunction, key, muteOutput, scheduler)
+            elif scheduler != None:
+                def makerecord(testFunction, maxPoints):
+                    return lambda: recordTestCase(testFunction, q, maxPoints, muteOutput)
+                testFunction = scheduler.add(q, makerecord(testFunction, question.getMaxPoints()))
+            question.addTestCase(testCase, testFunction)
 
         # Note extra function is necessary for scoping reasons
         def makefun(question):
@@ -302,7 +669,14 @@ def evaluate(generateSolutions, testRoot, moduleDict, exceptionMap=ERROR_HINT_MA
             for prereq in questionDicts[q].get('depends', '').split():
                 grades.addPrereq(q, prereq)
 
-    grades.grade(sys.modules[__name__], bonusPic = projectParams.BONUS_PIC)
+    if scheduler == None:
+        grades.grade(sys.modules[__name__], bonusPic = projectParams.BONUS_PIC)
+        return grades.points
+    try:
+        scheduler.start(grades)
+        grades.grade(sys.modules[__name__], bonusPic = projectParams.BONUS_PIC)
+    finally:
+        scheduler.stop()
     return grades.points
 
 
@@ -325,6 +699,13 @@ def getDisplay(graphicsByDefault, options=None):
 
 if __name__ == '__main__':
     options = readCommand(sys.argv)
+    if options.incremental and options.cacheDir == None:
+        options.cacheDir = DEFAULT_CACHE_DIR
+    if options.cacheDir != None:
+        import testParser
+        testParser.PARSE_CACHE_DIR = options.cacheDir
+        import layout
+        layout.LAYOUT_CACHE_DIR = os.path.join(options.cacheDir, 'layouts')
     if options.generateSolutions:
         confirmGenerate()
     codePaths = options.studentCode.split(',')
@@ -342,10 +723,16 @@ if __name__ == '__main__':
     moduleName = re.match('.*?([^/]*)\.py', options.testCaseCode).group(1)
     moduleDict['projectTestClasses'] = loadModuleFile(moduleName, os.path.join(options.codeRoot, options.testCaseCode))
 
+    resultCache = None
+    if options.incremental:
+        studentFiles = dict([(re.match('.*?([^/]*)\.py', cp).group(1), os.path.join(options.codeRoot, cp)) for cp in codePaths])
+        resultCache = ResultCache(options.cacheDir, options.codeRoot, studentFiles)
 
     if options.runTest != None:
         runTest(options.runTest, moduleDict, printTestCase=options.printTestCase, display=getDisplay(True, options))
     else:
         evaluate(options.generateSolutions, options.testRoot, moduleDict,
             edxOutput=options.edxOutput, muteOutput=options.muteOutput, printTestCase=options.printTestCase,
-            questionToGrade=options.gradeQuestion, display=getDisplay(options.gradeQuestion!=None, options))
+            questionToGrade=options.gradeQuestion, workers=options.workers,
+            resultCache=resultCache,
+            display=getDisplay(options.gradeQuestion!=None and options.workers <= 1, options))
@@ -48,6 +48,7 @@ def closestFood(pos, food, walls):
     """
     fringe = [(pos[0], pos[1], 0)]
     expanded = set()
+    legalNeighbors, height = Actions.getMoveTables(walls)[1], walls.height
     while fringe:
         pos_x, pos_y, dist = fringe.pop(0)
         if (pos_x, pos_y) in expanded:
@@ -57,7 +58,7 @@ def closestFood(pos, food, walls):
         if food[pos_x][pos_y]:
             return dist
         # otherwise spread out from the location to its neighbours
-        nbrs = Actions.getLegalNeighbors((pos_x, pos_y), walls)
+        nbrs = legalNeighbors[pos_x * height + pos_y]
         for nbr_x, nbr_y in nbrs:
             fringe.append((nbr_x, nbr_y, dist+1))
     # no food found
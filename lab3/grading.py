@@ -143,7 +143,16 @@ to follow your instructor's guidelines to receive credit on your project.
     """
     self.fail('FAIL: Exception raised: %s' % inst)
     self.addMessage('')
-    for line in traceback.format_exc().split('\n'):
+    # An exception raised again by a parallel autograder carries the frames
+    # of the test case that raised it in a worker
+    remoteFrames = getattr(inst, 'remoteFrames', None)
+    if remoteFrames == None:
+        message = traceback.format_exc()
+    else:
+        frames = traceback.extract_tb(sys.exc_info()[2])[:-1] + remoteFrames
+        message = 'Traceback (most recent call last):\n' + ''.join(traceback.format_list(frames)) + \
+                  ''.join(traceback.format_exception_only(type(inst), inst))
+    for line in message.split('\n'):
         self.addMessage(line)
 
   def addErrorHints(self, exceptionMap, errorInstance, questionNum):
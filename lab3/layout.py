@@ -14,39 +14,79 @@
 
 from util import manhattanDistance
 from game import Grid
+import hashlib
 import os
 import random
+import util
 
+# Parsed layouts by layoutHash, kept for the life of the process
+PARSED_LAYOUT_CACHE = {}
 VISIBILITY_MATRIX_CACHE = {}
 
+# Where parsed layouts and visibility matrices are kept between runs.  Off
+# (None) unless set here, by pacman.py --layoutCache or by PACMAN_LAYOUT_CACHE
+LAYOUT_CACHE_DIR = os.environ.get('PACMAN_LAYOUT_CACHE') or None
+_CACHE_VERSION = 2
+
+def layoutHash(layoutText):
+    "Returns the hex SHA-1 hash of the lines of a layout, the key of the layout caches."
+    return hashlib.sha1('\n'.join(layoutText)).hexdigest()
+
 class Layout:
     """
     A Layout manages the static information about the game board.
+
+    Boards with the same text are only parsed once per process: later
+    Layouts share the wall grid of the first one (and with it the legal
+    action tables of game.Actions) and get a copy of its food. The walls
+    are therefore read-only; deepCopy gives a layout with walls of its own.
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, digest=None):
         self.width = len(layoutText[0])
         self.height= len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
-        self.capsules = []
-        self.agentPositions = []
-        self.numGhosts = 0
-        self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.hash = digest or layoutHash(layoutText)
+        parsed = PARSED_LAYOUT_CACHE.get(self.hash)
+        if parsed == None:
+            self.walls = Grid(self.width, self.height, False)
+            self.food = Grid(self.width, self.height, False)
+            self.capsules = []
+            self.agentPositions = []
+            self.numGhosts = 0
+            self.processLayoutText(layoutText)
+            parsed = PARSED_LAYOUT_CACHE[self.hash] = self._parsed()
+        self._setParsed(parsed)
+        self.totalFood = self.food.count()
         # self.initializeVisibilityMatrix()
 
+    def _parsed(self):
+        return (self.walls, self.food, tuple(self.capsules), tuple(self.agentPositions), self.numGhosts)
+
+    def _setParsed(self, parsed):
+        walls, food, capsules, agentPositions, self.numGhosts = parsed
+        self.walls = walls
+        self.food = food.copy()
+        self.capsules = list(capsules)
+        self.agentPositions = list(agentPositions)
+
     def getNumGhosts(self):
         return self.numGhosts
 
     def initializeVisibilityMatrix(self):
-        global VISIBILITY_MATRIX_CACHE
-        if reduce(str.__add__, self.layoutText) not in VISIBILITY_MATRIX_CACHE:
+        """
+        Sets self.visibility[x][y][direction] to the set of (half step)
+        positions visible from (x, y) when looking in direction.
+        """
+        if self.hash not in VISIBILITY_MATRIX_CACHE:
+            vis = _loadCached(self.hash + '.visibility')
+            if vis != None: VISIBILITY_MATRIX_CACHE[self.hash] = vis
+        if self.hash not in VISIBILITY_MATRIX_CACHE:
             from game import Directions
             vecs = [(-0.5,0), (0.5,0),(0,-0.5),(0,0.5)]
             dirs = [Directions.NORTH, Directions.SOUTH, Directions.WEST, Directions.EAST]
-            vis = Grid(self.width, self.height, {Directions.NORTH:set(), Directions.SOUTH:set(), Directions.EAST:set(), Directions.WEST:set(), Directions.STOP:set()})
+            # Grids only hold booleans, so the sets live in nested lists
+            vis = [[dict([(direction, set()) for direction in dirs + [Directions.STOP]]) for y in range(self.height)] for x in range(self.width)]
             for x in range(self.width):
                 for y in range(self.height):
                     if self.walls[x][y] == False:
@@ -55,11 +95,10 @@ class Layout:
                             nextx, nexty = x + dx, y + dy
                             while (nextx + nexty) != int(nextx) + int(nexty) or not self.walls[int(nextx)][int(nexty)] :
                                 vis[x][y][direction].add((nextx, nexty))
-                                nextx, nexty = x + dx, y + dy
-            self.visibility = vis
-            VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)] = vis
-        else:
-            self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
+                                nextx, nexty = nextx + dx, nexty + dy
+            VISIBILITY_MATRIX_CACHE[self.hash] = vis
+            _saveCached(self.hash + '.visibility', vis)
+        self.visibility = VISIBILITY_MATRIX_CACHE[self.hash]
 
     def isWall(self, pos):
         x, col = pos
@@ -90,7 +129,9 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        layout = Layout(self.layoutText[:], self.hash)
+        layout.walls = self.walls.deepCopy()
+        return layout
 
     def processLayoutText(self, layoutText):
         """
@@ -129,21 +170,43 @@ class Layout:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
 def getLayout(name, back = 2):
-    if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
-    else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
-    if layout == None and back >= 0:
-        curdir = os.path.abspath('.')
-        os.chdir('..')
-        layout = getLayout(name, back -1)
-        os.chdir(curdir)
-    return layout
+    """
+    Loads layouts/<name>.lay or <name>.lay (the extension is optional) from
+    the current directory or, failing that, from up to back + 1 of its
+    parent directories.
+    """
+    if not name.endswith('.lay'): name += '.lay'
+    directory = ''
+    for level in range(back + 2):
+        for fullname in [os.path.join(directory, 'layouts', name), os.path.join(directory, name)]:
+            layout = tryToLoad(fullname)
+            if layout != None: return layout
+        directory = os.path.join(directory, os.pardir)
+    return None
 
 def tryToLoad(fullname):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: layoutText = [line.strip() for line in f]
     finally: f.close()
+    digest = layoutHash(layoutText)
+    cached = digest in PARSED_LAYOUT_CACHE
+    if not cached:
+        parsed = _loadCached(digest)
+        if parsed != None: PARSED_LAYOUT_CACHE[digest], cached = parsed, True
+    layout = Layout(layoutText, digest)
+    if not cached: _saveCached(digest, layout._parsed())
+    return layout
+
+def _cacheFile(name):
+    return os.path.join(LAYOUT_CACHE_DIR, name + '.pkl')
+
+def _loadCached(name):
+    "Returns the value stored by _saveCached under name, or None."
+    if LAYOUT_CACHE_DIR == None: return None
+    return util.loadCacheFile(_cacheFile(name), _CACHE_VERSION)
+
+def _saveCached(name, value):
+    "Stores value in LAYOUT_CACHE_DIR, unless it is already there."
+    if LAYOUT_CACHE_DIR == None or os.path.exists(_cacheFile(name)): return
+    util.saveCacheFile(_cacheFile(name), _CACHE_VERSION, value)
@@ -0,0 +1,230 @@
+# recording.py
+# ------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Compact binary recordings of Pacman games.
+
+A recording stores the SHA-1 hash of the layout text instead of the layout
+itself, one byte per move (agent index and action) and, every
+checkpointInterval moves, a snapshot of the game state. The layout is written
+once next to the recordings as <hash>.lay, so a tournament on one board keeps
+a single copy of it.
+
+File format (little endian):
+  header       MAGIC, layout hash (20 bytes), number of agents,
+               checkpoint interval, number of moves, number of checkpoints
+  moves        one byte per move: agentIndex << 3 | action code
+  offsets      one unsigned int per checkpoint: its position in the file
+  checkpoints  the state after moves interval, 2 * interval, ...
+               score, score change, win and lose flags, number of capsules,
+               the agent that moved last, the food and capsule eaten by the
+               last move (-1, -1 if none), capsules, agents (position,
+               direction, scared timer, eaten flag), packed food bits
+
+RecordedGame reads a recording lazily and can jump to any move by starting
+from the closest checkpoint before it. Moves are replayed with
+GameState._applyMove, so replaying does not count as exploring states.
+"""
+
+import os
+import struct
+from game import Directions, Configuration
+
+MAGIC = 'PACREC2\n'
+CHECKPOINT_INTERVAL = 100 # Default number of moves between two state snapshots
+
+_HEADER = struct.Struct('<8s20sHHII')
+_CHECKPOINT = struct.Struct('<iiBBHBhhhh')
+_CAPSULE = struct.Struct('<HH')
+_AGENT = struct.Struct('<hhBHB')
+_NO_AGENT = 0xFF
+_NO_POSITION = (-1, -1)
+
+_ACTIONS = [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP]
+_ACTION_CODES = dict((action, code) for code, action in enumerate(_ACTIONS))
+_MAX_AGENTS = 32 # Agent indices have to fit into the five high bits of a move
+
+def layoutHash( layout ):
+    "Returns the hex SHA-1 hash that identifies a layout in recordings."
+    import layout as layouts
+    return layouts.layoutHash(layout.layoutText)
+
+def isRecording( fileName ):
+    "Tells whether the file was written by writeRecording (and not pickled)."
+    f = open(fileName, 'rb')
+    try: return f.read(len(MAGIC)) == MAGIC
+    finally: f.close()
+
+def writeRecording( fileName, layout, numAgents, moveHistory, checkpointInterval=CHECKPOINT_INTERVAL ):
+    """
+    Writes the game played on layout with numAgents agents and the given
+    (agentIndex, action) moves to fileName, and <layout hash>.lay next to it
+    unless that file already exists.
+
+    The checkpoints are taken by replaying the moves; a checkpointInterval of
+    0 leaves them out.
+    """
+    if numAgents > _MAX_AGENTS:
+        raise Exception('Recordings support at most %d agents' % _MAX_AGENTS)
+    digest = layoutHash(layout)
+    layoutFile = os.path.join(os.path.dirname(fileName), digest + '.lay')
+    if not os.path.exists(layoutFile):
+        f = open(layoutFile, 'w')
+        try: f.write('\n'.join(layout.layoutText) + '\n')
+        finally: f.close()
+
+    moves = bytearray([agentIndex << 3 | _ACTION_CODES[action] for agentIndex, action in moveHistory])
+    checkpoints = []
+    if checkpointInterval > 0:
+        state = _initialState(layout, numAgents)
+        for number, move in enumerate(moveHistory):
+            state = state._applyMove(*move)
+            if (number + 1) % checkpointInterval == 0:
+                checkpoints.append(_packState(state))
+
+    offset = _HEADER.size + len(moves) + 4 * len(checkpoints)
+    offsets = []
+    for checkpoint in checkpoints:
+        offsets.append(offset)
+        offset += len(checkpoint)
+
+    f = open(fileName, 'wb')
+    try:
+        f.write(_HEADER.pack(MAGIC, digest.decode('hex'), numAgents, checkpointInterval, len(moves), len(checkpoints)))
+        f.write(moves)
+        f.write(struct.pack('<%dI' % len(offsets), *offsets))
+        f.write(''.join(checkpoints))
+    finally:
+        f.close()
+
+class RecordedGame:
+    """
+    A recording opened for replay. Moves are read from the file as they are
+    needed; getState(n) restores the state after n moves from the closest
+    checkpoint, so seeking costs at most checkpointInterval successors.
+
+    The layout is looked up as <hash>.lay in the recording's directory unless
+    it is given, in which case it has to match the recorded hash.
+    """
+    def __init__( self, fileName, layout=None ):
+        self.file = open(fileName, 'rb')
+        header = self.file.read(_HEADER.size)
+        if len(header) != _HEADER.size or not header.startswith(MAGIC):
+            raise Exception(fileName + ' is not a game recording')
+        _, digest, self.numAgents, self.checkpointInterval, self.numMoves, numCheckpoints = _HEADER.unpack(header)
+        self.layoutHash = digest.encode('hex')
+
+        if layout == None:
+            import layout as layouts
+            layoutFile = os.path.join(os.path.dirname(fileName), self.layoutHash + '.lay')
+            layout = layouts.tryToLoad(layoutFile)
+            if layout == None: raise Exception('The layout of %s (%s) cannot be found' % (fileName, layoutFile))
+        if layoutHash(layout) != self.layoutHash:
+            raise Exception('The layout does not match the one %s was recorded on' % fileName)
+        self.layout = layout
+
+        self.file.seek(_HEADER.size + self.numMoves)
+        self.checkpointOffsets = struct.unpack('<%dI' % numCheckpoints, self.file.read(4 * numCheckpoints))
+
+    def close( self ):
+        self.file.close()
+
+    def getMoves( self, start=0, end=None ):
+        "Returns moves start to end (exclusive) as (agentIndex, action) pairs."
+        if end == None or end > self.numMoves: end = self.numMoves
+        if start >= end: return []
+        self.file.seek(_HEADER.size + start)
+        return [(move >> 3, _ACTIONS[move & 7]) for move in bytearray(self.file.read(end - start))]
+
+    def getState( self, moveNumber ):
+        "Returns the game state after the first moveNumber moves."
+        if not 0 <= moveNumber <= self.numMoves:
+            raise IndexError('move %d is outside of the recording' % moveNumber)
+        state, number = _initialState(self.layout, self.numAgents), 0
+        checkpoint = min(moveNumber / self.checkpointInterval, len(self.checkpointOffsets)) if self.checkpointInterval else 0
+        if checkpoint > 0:
+            offset = self.checkpointOffsets[checkpoint - 1]
+            end = self.checkpointOffsets[checkpoint] if checkpoint < len(self.checkpointOffsets) else None
+            self.file.seek(offset)
+            data = self.file.read() if end == None else self.file.read(end - offset)
+            state, number = _unpackState(state, data), checkpoint * self.checkpointInterval
+        for move in self.getMoves(number, moveNumber):
+            state = state._applyMove(*move)
+        return state
+
+    def states( self, start=0, chunkSize=1024 ):
+        """
+        Yields the state after start moves, then the state after every
+        following move, reading the moves chunkSize at a time.
+        """
+        state = self.getState(start)
+        yield state
+        for chunk in range(start, self.numMoves, chunkSize):
+            for move in self.getMoves(chunk, chunk + chunkSize):
+                state = state._applyMove(*move)
+                yield state
+
+def _initialState( layout, numAgents ):
+    import pacman
+    state = pacman.GameState()
+    state.initialize(layout, numAgents - 1)
+    return state
+
+def _packPosition( position ):
+    # Agents move in half steps, so twice a coordinate is always an integer
+    return [int(round(2 * coordinate)) for coordinate in position]
+
+def _unpackPosition( x, y ):
+    return tuple([value / 2 if value % 2 == 0 else value / 2.0 for value in (x, y)])
+
+def _packState( state ):
+    data = state.data
+    agentMoved = _NO_AGENT if data._agentMoved == None else data._agentMoved
+    foodEaten = data._foodEaten or _NO_POSITION
+    capsuleEaten = data._capsuleEaten or _NO_POSITION
+    parts = [_CHECKPOINT.pack(data.score, data.scoreChange, data._win, data._lose, len(data.capsules),
+                              agentMoved, foodEaten[0], foodEaten[1], capsuleEaten[0], capsuleEaten[1])]
+    parts += [_CAPSULE.pack(x, y) for x, y in data.capsules]
+    for agentState, eaten in zip(data.agentStates, data._eaten):
+        x, y = _packPosition(agentState.configuration.pos)
+        parts.append(_AGENT.pack(x, y, _ACTION_CODES[agentState.configuration.direction], agentState.scaredTimer, eaten))
+    cells = data.food.width * data.food.height
+    parts.append(('%0*x' % ((cells + 7) / 8 * 2, data.food.asBitmask())).decode('hex'))
+    return ''.join(parts)
+
+def _unpackState( state, checkpoint ):
+    data = state.data
+    score, scoreChange, win, lose, numCapsules, agentMoved, foodX, foodY, capsuleX, capsuleY = _CHECKPOINT.unpack_from(checkpoint)
+    data.score, data.scoreChange, data._win, data._lose = score, scoreChange, bool(win), bool(lose)
+    data._agentMoved = None if agentMoved == _NO_AGENT else agentMoved
+    data._foodEaten = None if (foodX, foodY) == _NO_POSITION else (foodX, foodY)
+    data._capsuleEaten = None if (capsuleX, capsuleY) == _NO_POSITION else (capsuleX, capsuleY)
+    offset = _CHECKPOINT.size
+    data.capsules = [_CAPSULE.unpack_from(checkpoint, offset + i * _CAPSULE.size) for i in range(numCapsules)]
+    offset += numCapsules * _CAPSULE.size
+    eatenAgents = []
+    for index in range(len(data.agentStates)):
+        x, y, direction, scaredTimer, eaten = _AGENT.unpack_from(checkpoint, offset)
+        agentState = data.getWritableAgentState(index)
+        agentState.configuration = Configuration(_unpackPosition(x, y), _ACTIONS[direction])
+        agentState.scaredTimer = scaredTimer
+        eatenAgents.append(bool(eaten))
+        offset += _AGENT.size
+    data._eaten = eatenAgents
+    food = data.food.copy()
+    cells = food.width * food.height
+    bits = bin(int(checkpoint[offset:].encode('hex') or '0', 16))[2:].zfill(cells)
+    food.data[:] = bits[::-1][:cells].replace('0', '\x00').replace('1', '\x01')
+    data.food = food
+    return state